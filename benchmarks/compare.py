@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""
+Compare two result files from 'ttally bench' or run.py, printing the
+change in the fastest time for each scenario/operation in both
+"""
+
+import sys
+import json
+from typing import Any, Dict, Tuple
+
+import click
+
+
+def _by_scenario(results: Dict[str, Any]) -> Dict[Tuple[Any, ...], Dict[str, Any]]:
+    return {
+        tuple(sorted(s["scenario"].items())): s["results"]
+        for s in results.get("scenarios", [])
+    }
+
+
+@click.command()
+@click.argument("OLD", type=click.File("r"))
+@click.argument("NEW", type=click.File("r"))
+@click.option(
+    "--threshold",
+    default=1.1,
+    show_default=True,
+    help="exit with 1 if any operation got slower by more than this ratio",
+)
+def main(old: Any, new: Any, threshold: float) -> None:
+    old_results = _by_scenario(json.load(old))
+    new_results = _by_scenario(json.load(new))
+    regressed = False
+    for scenario, ops in new_results.items():
+        if scenario not in old_results:
+            continue
+        desc = ", ".join(f"{k}={v}" for k, v in scenario)
+        for op, timing in ops.items():
+            if op not in old_results[scenario]:
+                continue
+            before, after = old_results[scenario][op]["min"], timing["min"]
+            ratio = after / before if before > 0 else float("inf")
+            flag = ""
+            if ratio > threshold:
+                flag = "  <- slower"
+                regressed = True
+            click.echo(f"{desc}\t{op}\t{before:.4f}s -> {after:.4f}s\t{ratio:.2f}x{flag}")
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""
+Run the standard benchmark suite, saving the results to benchmarks/results
+
+To compare against another version, checkout that version, run this
+again, and then use compare.py on the two result files
+"""
+
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+import click
+
+from ttally.bench import run_benchmarks, scenario_matrix
+
+HERE = Path(__file__).absolute().parent
+
+# small/medium/large histories, for one device and for several synced devices
+SUITE = list(
+    scenario_matrix(
+        records=[1000, 10000, 50000],
+        devices=[1, 4],
+        months=[24],
+        formats=["yaml", "json", "merged"],
+    )
+)
+
+
+def _git_describe() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=HERE, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+@click.command()
+@click.option("--repeat", default=3, show_default=True)
+@click.option(
+    "-o",
+    "--output",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="[default: benchmarks/results/{git describe}.json]",
+)
+@click.option("--quick", is_flag=True, help="only run the smallest scenarios")
+def main(repeat: int, output: str, quick: bool) -> None:
+    scenarios = [s for s in SUITE if s.records == 1000] if quick else SUITE
+    results = run_benchmarks(
+        scenarios, repeat=repeat, progress=lambda msg: click.echo(msg, err=True)
+    )
+    version = _git_describe()
+    results["environment"]["git"] = version
+    path = Path(output) if output else HERE / "results" / f"{version}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2) + "\n")
+    click.echo(f"Wrote results to '{path}'", err=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
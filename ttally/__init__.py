@@ -45,14 +45,12 @@ def load_config_module(
         )
 
 
-# when 'ttally' module is imported, run default ttally.config
+# when 'ttally.config' is imported, run default ttally.config
+# (this is called from the ttally/config.py stub, so that importing
+# 'ttally' itself doesn't have to import the configuration)
 def setup_ttally_config() -> None:
     # if user doesn't want this to happen, set this envvar
     if "TTALLY_SKIP_DEFAULT_IMPORT" not in os.environ:
         from .core import Extension
 
         Extension().import_config()
-
-
-setup_ttally_config()
-del setup_ttally_config
@@ -0,0 +1,350 @@
+"""
+Group items by day/week/month/year and compute count/sum/mean/min/max, used
+by 'ttally agg', and for the rollups which 'ttally update-cache' maintains
+
+Instead of piping 'ttally export' through jq/datamash, this reads the serialized
+items (from the cache if its up to date, else the datafiles) one at a time, only
+keeping the running totals for each bucket in memory
+
+The value to aggregate can be a field, or an arithmetic expression using
+the fields on the model, like 'quantity * calories'. Expressions are parsed
+with the ast module, and only allow numbers, field names, arithmetic operators
+and a few functions (abs, round, min, max), so nothing else can be evaluated
+"""
+
+import ast
+from datetime import datetime, timedelta
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from .schema import ModelSchema
+
+By = Literal["day", "week", "month", "year", "all"]
+BY: Tuple[By, ...] = ("day", "week", "month", "year", "all")
+
+STATS = ("count", "sum", "mean", "min", "max")
+
+_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+}
+
+_OPERATORS = (
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Pow,
+    ast.UAdd,
+    ast.USub,
+)
+
+_NUMERIC = (int, float, bool)
+
+# bucket -> [count, sum, min, max], sum/min/max are None if only counting
+Stats = Dict[str, List[Any]]
+
+
+class Bucket(NamedTuple):
+    bucket: str
+    # 'count' would shadow tuple.count
+    items: int
+    sum: Optional[float]
+    mean: Optional[float]
+    min: Optional[float]
+    max: Optional[float]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "count": self.items,
+            "sum": self.sum,
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+        }
+
+
+def _check_expr(node: ast.AST, fields: Sequence[str], names: List[str]) -> None:
+    """
+    Make sure the expression only contains safe nodes, adding any fields it uses to names
+    """
+    if isinstance(node, ast.Expression):
+        _check_expr(node.body, fields, names)
+    elif isinstance(node, ast.Constant):
+        if type(node.value) not in _NUMERIC:
+            raise ValueError(f"Only numbers can be used in expressions, got {node.value!r}")
+    elif isinstance(node, ast.Name):
+        if node.id not in fields:
+            raise ValueError(
+                f"Unknown field '{node.id}', expected one of {', '.join(fields)}"
+            )
+        if node.id not in names:
+            names.append(node.id)
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, _OPERATORS):
+        _check_expr(node.left, fields, names)
+        _check_expr(node.right, fields, names)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, _OPERATORS):
+        _check_expr(node.operand, fields, names)
+    elif (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id in _FUNCTIONS
+        and node.func.id not in fields
+        and not node.keywords
+    ):
+        for arg in node.args:
+            _check_expr(arg, fields, names)
+    else:
+        raise ValueError(f"{type(node).__name__} isn't allowed in expressions")
+
+
+def compile_expr(
+    expr: str, fields: Sequence[str]
+) -> Tuple[List[str], Callable[..., Any]]:
+    """
+    Returns the fields the expression uses, and a function which
+    takes the values for those fields (in that order) and computes it
+    """
+    try:
+        tree = ast.parse(expr.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Could not parse expression '{expr}': {e.msg}")
+    names: List[str] = []
+    _check_expr(tree, fields, names)
+    # wrap the (checked) expression in a lambda, so its
+    # compiled once instead of evaluated for each item
+    func = ast.parse(f"lambda {', '.join(names)}: 0", mode="eval")
+    assert isinstance(func.body, ast.Lambda)
+    func.body.body = tree.body
+    ast.fix_missing_locations(func)
+    code = compile(func, "<ttally agg>", "eval")
+    return names, eval(code, {"__builtins__": {}, **_FUNCTIONS})
+
+
+class _Bucketer:
+    """
+    Returns the bucket an epoch falls into, in local time. Remembers the
+    range for the last bucket, since items are usually sorted
+    """
+
+    def __init__(self, by: By) -> None:
+        self.by = by
+        self._lo = 0.0
+        self._hi = 0.0
+        self._label = ""
+
+    def _range(self, dt: datetime) -> Tuple[datetime, datetime, str]:
+        day = datetime(dt.year, dt.month, dt.day)
+        if self.by == "day":
+            return day, day + timedelta(days=1), day.strftime("%Y-%m-%d")
+        elif self.by == "week":
+            # weeks start on monday
+            start = day - timedelta(days=day.weekday())
+            return start, start + timedelta(days=7), start.strftime("%Y-%m-%d")
+        elif self.by == "month":
+            start = datetime(dt.year, dt.month, 1)
+            end = datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+            return start, end, start.strftime("%Y-%m")
+        else:
+            start = datetime(dt.year, 1, 1)
+            return start, datetime(dt.year + 1, 1, 1), start.strftime("%Y")
+
+    def __call__(self, epoch: float) -> str:
+        if self._lo <= epoch < self._hi:
+            return self._label
+        start, end, self._label = self._range(datetime.fromtimestamp(epoch))
+        self._lo, self._hi = start.timestamp(), end.timestamp()
+        return self._label
+
+
+class Aggregation:
+    """
+    Computes the stats for each bucket, for the value of a field/expression
+
+    If there's no expression, only counts the items in each bucket
+    """
+
+    def __init__(self, schema: ModelSchema, *, expr: Optional[str], by: By) -> None:
+        if by not in BY:
+            raise ValueError(f"Unknown bucket '{by}', expected one of {BY}")
+        self.by = by
+        self.expr = expr
+        self.dt_attr = schema.dt_attr
+        self.func: Optional[Callable[..., Any]] = None
+        # the fields the expression uses
+        self.fields: List[str] = []
+        if expr is not None:
+            self.fields, self.func = compile_expr(
+                expr, [f for f in schema.fields if f != self.dt_attr]
+            )
+            for f in self.fields:
+                attr_type, _ = schema.types[f]
+                if attr_type not in _NUMERIC:
+                    raise ValueError(
+                        f"'{f}' is a {getattr(attr_type, '__name__', attr_type)}, can only aggregate numeric fields"
+                    )
+
+    def partial(self, rows: Iterable[Sequence[Any]]) -> Stats:
+        """
+        rows are (epoch, *values for self.fields), returns the running stats for each
+        bucket. These can be combined with merge_stats, e.g. for each datafile
+        """
+        bucket_of: Callable[[float], str] = (
+            (lambda _: "all") if self.by == "all" else _Bucketer(self.by)
+        )
+        stats: Stats = {}
+        func = self.func
+        for row in rows:
+            label = bucket_of(row[0])
+            st = stats.get(label)
+            if func is None:
+                if st is None:
+                    stats[label] = [1, None, None, None]
+                else:
+                    st[0] += 1
+                continue
+            values = row[1:]
+            if None in values:
+                # missing (Optional) values are skipped, like datamash with --narm
+                continue
+            try:
+                value = func(*values)
+            except (ArithmeticError, TypeError, ValueError) as e:
+                raise ValueError(
+                    f"Could not compute '{self.expr}' for {dict(zip(self.fields, values))}: {e}"
+                )
+            if st is None:
+                stats[label] = [1, value, value, value]
+            else:
+                st[0] += 1
+                st[1] += value
+                if value < st[2]:
+                    st[2] = value
+                elif value > st[3]:
+                    st[3] = value
+        return stats
+
+    def run(self, rows: Iterable[Sequence[Any]]) -> List[Bucket]:
+        """
+        Returns the stats for each bucket, oldest first
+        """
+        return to_buckets(self.partial(rows))
+
+    def bucket_range(
+        self, since: Optional[datetime], until: Optional[datetime]
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        The first and last buckets which include any time from since (inclusive) to until (exclusive)
+        """
+        if self.by == "all":
+            return None, None
+        bucket_of = _Bucketer(self.by)
+        return (
+            bucket_of(since.timestamp()) if since is not None else None,
+            bucket_of(until.timestamp() - 1) if until is not None else None,
+        )
+
+
+def merge_stats(partials: Iterable[Stats]) -> Stats:
+    """
+    Combine the running stats from Aggregation.partial
+    """
+    merged: Stats = {}
+    for stats in partials:
+        for label, (count, total, lo, hi) in stats.items():
+            st = merged.get(label)
+            if st is None:
+                merged[label] = [count, total, lo, hi]
+            elif total is None:
+                st[0] += count
+            else:
+                st[0] += count
+                st[1] += total
+                st[2] = min(st[2], lo)
+                st[3] = max(st[3], hi)
+    return merged
+
+
+def to_buckets(stats: Stats) -> List[Bucket]:
+    return [
+        Bucket(
+            bucket=label,
+            items=count,
+            sum=total,
+            mean=None if total is None else total / count,
+            min=lo,
+            max=hi,
+        )
+        for label, (count, total, lo, hi) in sorted(stats.items())
+    ]
+
+
+class Rollup(NamedTuple):
+    """
+    A precomputed aggregation, declared on a model with a 'rollups' staticmethod:
+
+    class Food(NamedTuple):
+        when: datetime
+        calories: int
+        quantity: float
+
+        @staticmethod
+        def rollups() -> dict:
+            return {
+                "calories": {"expr": "quantity * calories", "by": "day"},
+                "entries": {"by": "month"},
+            }
+
+    Each value can have a 'field' or 'expr' (if neither, only counts items),
+    and 'by' (defaults to 'day')
+    """
+
+    name: str
+    expr: Optional[str]
+    by: By
+
+
+def model_rollups(nt: Type[NamedTuple]) -> List[Rollup]:
+    """
+    The rollups declared on a model, if any
+    """
+    func = getattr(nt, "rollups", None)
+    if func is None:
+        return []
+    declared = func()
+    if not isinstance(declared, dict):
+        raise TypeError(f"{nt.__name__}.rollups() should return a dict, got {declared!r}")
+    rollups: List[Rollup] = []
+    for name, spec in declared.items():
+        if not isinstance(spec, dict) or set(spec) - {"field", "expr", "by"}:
+            raise ValueError(
+                f"{nt.__name__}.rollups() '{name}' should be a dict with 'field'/'expr' and 'by', got {spec!r}"
+            )
+        if "field" in spec and "expr" in spec:
+            raise ValueError(
+                f"{nt.__name__}.rollups() '{name}' has a 'field' and an 'expr', expected one"
+            )
+        by = spec.get("by", "day")
+        if by not in BY:
+            raise ValueError(
+                f"{nt.__name__}.rollups() '{name}' has unknown 'by' '{by}', expected one of {BY}"
+            )
+        rollups.append(
+            Rollup(name=str(name), expr=spec.get("field", spec.get("expr")), by=by)
+        )
+    return rollups
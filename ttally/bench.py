@@ -0,0 +1,431 @@
+"""
+Benchmarks for the common operations, used by 'ttally bench'
+
+This generates synthetic data directories (varying the number of items, devices,
+months and the datafile format) for some NamedTuple models, and then times loading,
+caching, 'recent', 'export', 'from-json' and 'merge' against them. Everything
+happens in a temporary directory, so this never touches the real datafiles/cache
+
+The results are JSON, so they can be saved and compared between versions
+"""
+
+import os
+import json
+import time
+import random
+import shutil
+import tempfile
+import statistics
+from pathlib import Path
+from datetime import datetime
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from .core import Extension
+
+DEFAULT_CONFIG = '''\
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+
+class Food(NamedTuple):
+    when: datetime
+    calories: int
+    food: str
+    quantity: float
+    water: Optional[int]
+
+
+class Weight(NamedTuple):
+    when: datetime
+    pounds: float
+'''
+
+FORMATS = ("yaml", "json", "merged")
+
+_WORDS = (
+    "apple banana coffee tea rice ramen egg toast oatmeal yogurt salad soup "
+    "chicken tofu pasta pizza burrito curry sandwich cereal chips cookie"
+).split()
+
+
+class Scenario(NamedTuple):
+    records: int
+    devices: int
+    months: int
+    format: str
+
+    def describe(self) -> str:
+        return f"{self.records} items/model, {self.devices} devices, {self.months} months, {self.format}"
+
+
+class BenchExtension(Extension):
+    """
+    Keeps everything (including merge backups) inside the benchmark directory
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        # never send requests to a 'ttally daemon' which is running for the real data
+        self.socket_path = self.cache_dir / "ttally.sock"
+
+    def check_import(self) -> None:
+        pass
+
+    def temp_dir(self) -> Path:
+        tdir = self.cache_dir / "tmp"
+        tdir.mkdir(parents=True, exist_ok=True)
+        return tdir
+
+
+def _months(count: int) -> List[Tuple[int, int]]:
+    """
+    The last 'count' months, ending with the current month
+    """
+    now = datetime.now()
+    year, month = now.year, now.month
+    months = []
+    for _ in range(count):
+        months.append((year, month))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return list(reversed(months))
+
+
+def _month_bounds(year: int, month: int) -> Tuple[int, int]:
+    start = datetime(year, month, 1).timestamp()
+    end = datetime(year + month // 12, month % 12 + 1, 1).timestamp()
+    return int(start), int(min(end, time.time()))
+
+
+def _random_value(rng: random.Random, attr_type: Any, optional: bool) -> Any:
+    from enum import Enum
+    from autotui.typehelpers import is_supported_container, get_collection_types
+
+    if optional and rng.random() < 0.1:
+        return None
+    if attr_type is bool:
+        return rng.random() < 0.5
+    if attr_type is int:
+        return rng.randint(0, 1000)
+    if attr_type is float:
+        return round(rng.uniform(0, 100), 2)
+    if attr_type is str:
+        return " ".join(rng.choices(_WORDS, k=rng.randint(1, 3)))
+    if isinstance(attr_type, type) and issubclass(attr_type, Enum):
+        return rng.choice(list(attr_type)).name
+    if is_supported_container(attr_type):
+        _, internal_type = get_collection_types(attr_type)
+        return [
+            _random_value(rng, internal_type, False) for _ in range(rng.randint(0, 3))
+        ]
+    raise ValueError(f"Can't generate values for {attr_type}")
+
+
+def generate_items(
+    nt: Type[NamedTuple], *, count: int, start: int, end: int, rng: random.Random
+) -> List[Dict[str, Any]]:
+    """
+    Generate serialized items for a model, with datetimes between start and end
+    """
+    schema = Extension.schema(nt)
+    dt_attr = schema.dt_attr
+    items = []
+    for _ in range(count):
+        item = {
+            name: _random_value(rng, attr_type, optional)
+            for name, (attr_type, optional) in schema.types.items()
+            if name != dt_attr
+        }
+        item[dt_attr] = rng.randint(start, max(start, end - 1))
+        items.append(item)
+    return items
+
+
+def _write_datafile(path: Path, items: List[Dict[str, Any]]) -> None:
+    if path.suffix == ".json":
+        path.write_text(json.dumps(items, indent=4))
+    else:
+        import yaml
+
+        path.write_text(yaml.safe_dump(items))
+
+
+def generate_data(
+    ext: Extension, scenario: Scenario, *, seed: int = 0
+) -> Dict[str, int]:
+    """
+    Write a data directory for a scenario, returns the number of datafiles for each model
+    """
+    rng = random.Random(seed)
+    if ext.data_dir.exists():
+        shutil.rmtree(ext.data_dir)
+    ext.data_dir.mkdir(parents=True)
+    months = _months(scenario.months)
+    devices = [f"bench-device{i}" for i in range(scenario.devices)]
+    ext_name = "json" if scenario.format == "json" else "yaml"
+
+    counts: Dict[str, int] = {}
+    for model, nt in ext.MODELS.items():
+        files: Dict[Path, List[Dict[str, Any]]] = {}
+        # spread the items evenly across each (device, month)
+        slots = [(d, m) for m in months for d in devices]
+        per_slot, extra = divmod(scenario.records, len(slots))
+        for i, (device, (year, month)) in enumerate(slots):
+            start, end = _month_bounds(year, month)
+            items = generate_items(
+                nt, count=per_slot + (i < extra), start=start, end=end, rng=rng
+            )
+            if scenario.format == "merged":
+                files.setdefault(ext.ttally_merged_path(model), []).extend(items)
+            else:
+                path = ext.data_dir / f"{model}-{device}-{year}-{month:02d}.{ext_name}"
+                files[path] = items
+        for path, items in files.items():
+            _write_datafile(path, items)
+        counts[model] = len(files)
+    return counts
+
+
+def _clear_cache(ext: Extension) -> None:
+    if ext.cache_dir.exists():
+        shutil.rmtree(ext.cache_dir)
+    ext.cache_dir.mkdir(parents=True)
+
+
+def _invoke(ext: Extension, args: Sequence[str], stdin: Optional[str] = None) -> None:
+    from click.testing import CliRunner
+    from .main import wrap_accessor
+
+    result = CliRunner().invoke(wrap_accessor(extension=ext), list(args), input=stdin)
+    if result.exception is not None and not isinstance(result.exception, SystemExit):
+        raise result.exception
+    if result.exit_code != 0:
+        raise RuntimeError(f"'ttally {' '.join(args)}' exited with {result.exit_code}")
+
+
+# each operation has a setup function (not timed), and the function which is timed
+Operation = Tuple[Callable[[], None], Callable[[], None]]
+
+
+def operations(
+    make_ext: Callable[[], Extension], scenario: Scenario, *, seed: int = 0
+) -> Dict[str, Operation]:
+    """
+    The operations to time, in the order they're run. Each run
+    uses a new Extension, like each command would
+    """
+    setup_ext = make_ext()
+    models = list(setup_ext.MODELS)
+    rng = random.Random(seed)
+
+    def _nothing() -> None:
+        pass
+
+    def _regenerate() -> None:
+        generate_data(setup_ext, scenario, seed=seed)
+        _clear_cache(setup_ext)
+
+    def _warm() -> None:
+        # a no-op if the cache is up to date
+        setup_ext.cache_sorted_exports()
+
+    def _glob() -> None:
+        ext = make_ext()
+        for nt in ext.MODELS.values():
+            for _ in ext.glob_namedtuple(nt):
+                pass
+
+    def _cache() -> None:
+        make_ext().cache_sorted_exports()
+
+    def _cli(*args: str) -> Callable[[], None]:
+        def _run() -> None:
+            ext = make_ext()
+            for model in models:
+                _invoke(ext, [a.format(model=model) for a in args])
+
+        return _run
+
+    def _from_json() -> None:
+        ext = make_ext()
+        now = int(time.time())
+        for model, nt in ext.MODELS.items():
+            items = generate_items(nt, count=10, start=now - 60, end=now, rng=rng)
+            _invoke(ext, ["from-json", model], stdin=json.dumps(items))
+
+    return {
+        "glob_namedtuple": (lambda: _clear_cache(setup_ext), _glob),
+        "cache_sorted_exports": (lambda: _clear_cache(setup_ext), _cache),
+        "recent": (_warm, _cli("recent", "{model}", "10")),
+        "recent_timedelta": (_warm, _cli("recent", "{model}", "7d")),
+        "export_stream": (_warm, _cli("export", "{model}", "--stream")),
+        # without a cache (or manifest), so these read the datafiles
+        "recent_cold": (
+            lambda: _clear_cache(setup_ext),
+            _cli("recent", "{model}", "10"),
+        ),
+        "export_stream_cold": (
+            lambda: _clear_cache(setup_ext),
+            _cli("export", "{model}", "--stream"),
+        ),
+        "from_json": (_nothing, _from_json),
+        "merge": (_regenerate, _cli("merge", "{model}", "-R")),
+    }
+
+
+OPERATIONS = (
+    "glob_namedtuple",
+    "cache_sorted_exports",
+    "recent",
+    "recent_timedelta",
+    "export_stream",
+    "recent_cold",
+    "export_stream_cold",
+    "from_json",
+    "merge",
+)
+
+
+def _time(setup: Callable[[], None], run: Callable[[], None], repeat: int) -> Dict[str, Any]:
+    runs = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        run()
+        runs.append(time.perf_counter() - start)
+    return {
+        "runs": [round(r, 6) for r in runs],
+        "min": round(min(runs), 6),
+        "median": round(statistics.median(runs), 6),
+    }
+
+
+def run_scenario(
+    scenario: Scenario,
+    *,
+    config: str,
+    directory: Path,
+    repeat: int = 3,
+    ops: Sequence[str] = OPERATIONS,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Generate the data for one scenario and time each operation
+    """
+    config_file = directory / "bench_config.py"
+    config_file.write_text(config)
+
+    def make_ext() -> Extension:
+        ext = BenchExtension(
+            name="ttally-bench",
+            config_module_name="ttally_bench_config",
+            config_file=str(config_file),
+            data_dir=str(directory / "data"),
+            cache_dir=str(directory / "cache"),
+        )
+        ext.extension = "json" if scenario.format == "json" else "yaml"
+        return ext
+
+    ext = make_ext()
+    datafiles = generate_data(ext, scenario, seed=seed)
+    _clear_cache(ext)
+
+    results: Dict[str, Any] = {}
+    available = operations(make_ext, scenario, seed=seed)
+    for op in OPERATIONS:
+        if op in ops:
+            setup, run = available[op]
+            results[op] = _time(setup, run, repeat)
+    return {
+        "scenario": scenario._asdict(),
+        "models": list(ext.MODELS),
+        "datafiles": datafiles,
+        "results": results,
+    }
+
+
+def _environment() -> Dict[str, Any]:
+    import platform
+
+    try:
+        from importlib.metadata import version
+
+        ttally_version: Optional[str] = version("ttally")
+    except Exception:
+        ttally_version = None
+    try:
+        import orjson  # type: ignore[import]  # noqa: F401
+
+        has_orjson = True
+    except ImportError:
+        has_orjson = False
+    return {
+        "ttally": ttally_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "orjson": has_orjson,
+        "env": {
+            k: v
+            for k, v in os.environ.items()
+            if k in ("TTALLY_PARALLEL", "TTALLY_CACHE_FORMAT", "TTALLY_APPEND")
+        },
+        "timestamp": int(time.time()),
+    }
+
+
+def run_benchmarks(
+    scenarios: Sequence[Scenario],
+    *,
+    config: str = DEFAULT_CONFIG,
+    repeat: int = 3,
+    ops: Sequence[str] = OPERATIONS,
+    seed: int = 0,
+    progress: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Run each scenario in its own temporary directory, returning the results
+    """
+    unknown = set(ops) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operations {sorted(unknown)}, expected {OPERATIONS}")
+    results = []
+    for scenario in scenarios:
+        if scenario.format not in FORMATS:
+            raise ValueError(f"Unknown format {scenario.format}, expected {FORMATS}")
+        if progress is not None:
+            progress(f"Running {scenario.describe()}")
+        with tempfile.TemporaryDirectory(prefix="ttally-bench-") as tdir:
+            results.append(
+                run_scenario(
+                    scenario,
+                    config=config,
+                    directory=Path(tdir),
+                    repeat=repeat,
+                    ops=ops,
+                    seed=seed,
+                )
+            )
+    return {"environment": _environment(), "scenarios": results}
+
+
+def scenario_matrix(
+    records: Sequence[int],
+    devices: Sequence[int],
+    months: Sequence[int],
+    formats: Sequence[str],
+) -> Iterator[Scenario]:
+    for fmt in formats:
+        for r in records:
+            for d in devices:
+                for m in months:
+                    yield Scenario(records=r, devices=d, months=m, format=fmt)
@@ -0,0 +1,364 @@
+"""
+Readers for the sorted model caches written by 'ttally update-cache'
+
+Both the JSON and columnar caches are exposed with the same interface: the
+number of rows, a sorted column of epoch seconds for the datetime attribute
+(which can be binary searched) and a way to read a slice of the rows
+"""
+
+import sys
+import json
+import struct
+from abc import ABC, abstractmethod
+from array import array
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from .core import load_json, dump_json
+
+Row = Dict[str, Any]
+
+COLUMNAR_MAGIC = b"TTALLYC1"
+_HEADER_LEN = struct.Struct("<Q")
+
+
+class CachedRows(ABC):
+    """
+    Sorted (oldest first) rows for a model
+
+    This can be used as a context manager, to close any open files when done
+    """
+
+    dt_attr: str
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @property
+    @abstractmethod
+    def epochs(self) -> Sequence[int]:
+        """
+        The datetime attribute for each row, as epoch seconds
+        """
+
+    @abstractmethod
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Row]:
+        ...
+
+    def columns(
+        self, fields: Sequence[str], start: int = 0, stop: Optional[int] = None
+    ) -> Iterator[Tuple[Any, ...]]:
+        """
+        Read only some fields from each row, as tuples
+        """
+        from operator import itemgetter
+
+        if len(fields) == 1:
+            return ((o[fields[0]],) for o in self.rows(start, stop))
+        return map(itemgetter(*fields), self.rows(start, stop))
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "CachedRows":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def iter_rows(
+    cache: CachedRows, start: int = 0, stop: Optional[int] = None
+) -> Iterator[Row]:
+    """
+    Read rows from a cache, closing it when done
+    """
+    with cache:
+        yield from cache.rows(start, stop)
+
+
+def iter_columns(
+    cache: CachedRows,
+    fields: Sequence[str],
+    start: int = 0,
+    stop: Optional[int] = None,
+) -> Iterator[Tuple[Any, ...]]:
+    """
+    Read some fields from each row from a cache, closing it when done
+    """
+    with cache:
+        yield from cache.columns(fields, start, stop)
+
+
+def iter_rows_newest(cache: CachedRows) -> Iterator[Row]:
+    """
+    Read rows from a cache newest first, closing it when done. Reads
+    increasingly large chunks, so if only the first few rows are used,
+    the rest are never read
+    """
+    with cache:
+        stop = len(cache)
+        chunk = 64
+        while stop > 0:
+            start = max(0, stop - chunk)
+            rows = list(cache.rows(start, stop))
+            rows.reverse()
+            yield from rows
+            stop = start
+            chunk = min(chunk * 4, 16384)
+
+
+class JSONCache(CachedRows):
+    def __init__(self, data: List[Row], *, dt_attr: str) -> None:
+        self.data = data
+        self.dt_attr = dt_attr
+        self._epochs: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def epochs(self) -> Sequence[int]:
+        if self._epochs is None:
+            self._epochs = [o[self.dt_attr] for o in self.data]
+        return self._epochs
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Row]:
+        if start == 0 and stop is None:
+            return iter(self.data)
+        return iter(self.data[start:stop])
+
+
+def write_json_cache(path: Path, rows: Sequence[Row]) -> None:
+    """
+    Write rows to a JSON cache file. This is a regular JSON list, but with
+    one row per line, so that it can also be read one row at a time
+    """
+    import os
+
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with tmp.open("w") as f:
+        f.write("[\n")
+        for i, o in enumerate(rows):
+            if i > 0:
+                f.write(",\n")
+            f.write(dump_json(o))
+        f.write("\n]\n")
+    os.replace(tmp, path)
+
+
+def iter_json_cache(path: Path) -> Iterator[Row]:
+    """
+    Read rows from a JSON cache file one at a time, without
+    loading the whole file into memory
+    """
+    with path.open("r") as f:
+        first = f.readline()
+        if first.strip() != "[":
+            # not written one row per line, parse the whole file
+            yield from load_json(first + f.read())
+            return
+        for line in f:
+            line = line.rstrip().rstrip(",")
+            if not line or line == "]":
+                continue
+            yield load_json(line)
+
+
+def iter_json_cache_newest(path: Path, block_size: int = 65536) -> Iterator[Row]:
+    """
+    Read rows from a JSON cache file newest first, one at a time. This reads
+    the file backwards in blocks, so only the lines which are used are parsed
+    """
+    import os
+
+    with path.open("rb") as f:
+        if f.readline().strip() != b"[":
+            # not written one row per line, parse the whole file
+            f.seek(0)
+            yield from reversed(load_json(f.read()))
+            return
+        body_start = f.tell()
+        pos = f.seek(0, os.SEEK_END)
+        # the (possibly incomplete) first line of the last block read
+        partial = b""
+        while pos > body_start:
+            size = min(block_size, pos - body_start)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + partial).split(b"\n")
+            partial = lines[0]
+            for line in reversed(lines[1:]):
+                line = line.rstrip().rstrip(b",")
+                if line and line != b"]":
+                    yield load_json(line)
+        partial = partial.rstrip().rstrip(b",")
+        if partial and partial != b"]":
+            yield load_json(partial)
+
+
+class ColumnarCache(CachedRows):
+    """
+    A memory-mapped columnar cache file, which looks like:
+
+    magic (8 bytes) | header length (8 bytes) | JSON header (padded to 8 bytes)
+    int64 epochs for each row
+    for each other field: int64 offsets (rows + 1) into its data, then the
+    JSON-encoded value for each row
+
+    Positions in the header are relative to the end of the header, so only
+    the rows which are requested are ever decoded
+    """
+
+    def __init__(self, path: Path) -> None:
+        import mmap
+
+        self.path = path
+        with path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse_header()
+        except Exception:
+            self._mmap.close()
+            raise
+
+    def _parse_header(self) -> None:
+        mm = self._mmap
+        if mm[: len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+            raise RuntimeError(f"{self.path} is not a columnar cache file")
+        header_start = len(COLUMNAR_MAGIC) + _HEADER_LEN.size
+        (header_len,) = _HEADER_LEN.unpack_from(mm, len(COLUMNAR_MAGIC))
+        header = json.loads(mm[header_start : header_start + header_len])
+        if header["byteorder"] != sys.byteorder:
+            raise RuntimeError(f"{self.path} was written on a different platform")
+
+        self.dt_attr = header["dt_attr"]
+        self.fields: List[str] = header["fields"]
+        self._rows: int = header["rows"]
+        self._base = header_start + header_len
+
+        self._view = memoryview(mm)
+        epochs_at = self._base + header["epochs"]
+        self._epochs = self._view[epochs_at : epochs_at + self._rows * 8].cast("q")
+        self._columns: Dict[str, Any] = {}
+        self._data_at: Dict[str, int] = {}
+        for field, (offsets_at, data_at) in header["columns"].items():
+            start = self._base + offsets_at
+            self._columns[field] = self._view[start : start + (self._rows + 1) * 8].cast(
+                "q"
+            )
+            self._data_at[field] = self._base + data_at
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @property
+    def epochs(self) -> Sequence[int]:
+        return self._epochs  # type: ignore[no-any-return]
+
+    def _value(self, field: str, i: int) -> Any:
+        offsets = self._columns[field]
+        at = self._data_at[field]
+        return load_json(self._mmap[at + offsets[i] : at + offsets[i + 1]])
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Row]:
+        if stop is None or stop > self._rows:
+            stop = self._rows
+        for i in range(max(start, 0), stop):
+            yield {
+                f: self._epochs[i] if f == self.dt_attr else self._value(f, i)
+                for f in self.fields
+            }
+
+    def columns(
+        self, fields: Sequence[str], start: int = 0, stop: Optional[int] = None
+    ) -> Iterator[Tuple[Any, ...]]:
+        # only decodes the values for the requested fields
+        if stop is None or stop > self._rows:
+            stop = self._rows
+        mm = self._mmap
+        epochs = self._epochs
+        cols = [
+            None if f == self.dt_attr else (self._columns[f], self._data_at[f])
+            for f in fields
+        ]
+        for i in range(max(start, 0), stop):
+            yield tuple(
+                epochs[i]
+                if col is None
+                else load_json(mm[col[1] + col[0][i] : col[1] + col[0][i + 1]])
+                for col in cols
+            )
+
+    def close(self) -> None:
+        self._epochs.release()
+        for col in self._columns.values():
+            col.release()
+        self._view.release()
+        self._mmap.close()
+
+
+def write_columnar_cache(
+    path: Path, rows: Sequence[Row], *, dt_attr: str, fields: Sequence[str]
+) -> None:
+    """
+    Write rows (already sorted by dt_attr) to a columnar cache file
+    """
+    import os
+
+    epochs = array("q", (int(o[dt_attr]) for o in rows))
+    other_fields = [f for f in fields if f != dt_attr]
+
+    # compute each column before writing anything, so the positions are known
+    columns: List[Any] = []
+    for field in other_fields:
+        offsets = array("q", [0])
+        data = bytearray()
+        for o in rows:
+            data += json.dumps(o.get(field), separators=(",", ":")).encode("utf-8")
+            offsets.append(len(data))
+        # keep every section 8-byte aligned
+        data += b"\0" * (-len(data) % 8)
+        columns.append((field, offsets, data))
+
+    at = len(epochs) * 8
+    positions: Dict[str, List[int]] = {}
+    for field, offsets, data in columns:
+        offsets_at = at
+        at += len(offsets) * 8
+        positions[field] = [offsets_at, at]
+        at += len(data)
+
+    header = json.dumps(
+        {
+            "byteorder": sys.byteorder,
+            "dt_attr": dt_attr,
+            "fields": list(fields),
+            "rows": len(rows),
+            "epochs": 0,
+            "columns": positions,
+        }
+    ).encode("utf-8")
+    header += b" " * (-(len(header) + len(COLUMNAR_MAGIC) + _HEADER_LEN.size) % 8)
+
+    # write to a temporary file and move it into place, so readers
+    # never see a partially written cache
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with tmp.open("wb") as f:
+        f.write(COLUMNAR_MAGIC)
+        f.write(_HEADER_LEN.pack(len(header)))
+        f.write(header)
+        f.write(epochs.tobytes())
+        for _, offsets, data in columns:
+            f.write(offsets.tobytes())
+            f.write(data)
+    os.replace(tmp, path)
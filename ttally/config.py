@@ -1,3 +1,9 @@
 # stub file to make mypy happy
 # you should setup a config file at ~/.config/ttally.py instead
 # see https://github.com/seanbreckenridge/ttally
+
+# if this is imported directly (e.g. 'from ttally.config import Food'),
+# the users configuration is loaded and replaces this module
+from ttally import setup_ttally_config
+
+setup_ttally_config()
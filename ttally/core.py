@@ -4,6 +4,8 @@ Encapsulates all interaction with ttally under a class, so its easier to extend
 
 import sys
 import os
+import time
+import struct
 import inspect
 from pathlib import Path
 from typing import (
@@ -14,6 +16,8 @@ from typing import (
     Callable,
     TYPE_CHECKING,
     Iterator,
+    Iterable,
+    Tuple,
     cast,
     Any,
     NamedTuple,
@@ -21,11 +25,24 @@ from typing import (
     Type,
     List,
     Dict,
+    Sequence,
     TextIO,
+    ContextManager,
+    get_args,
 )
 from datetime import datetime, timedelta
+from functools import cached_property
+
+from .trace import Tracer
 
 FileHashes = Dict[str, str]
+CacheFormat = Literal["json", "columnar"]
+# [mtime_ns, size] for a datafile
+DatafileKey = List[int]
+DatafileIndex = Dict[str, DatafileKey]
+# [mtime_ns, size, min epoch, max epoch] for each datafile when it was
+# cached, the epochs are None if the datafile doesn't have any items
+DatafileCacheIndex = Dict[str, List[Optional[int]]]
 
 
 T = TypeVar("T")
@@ -33,6 +50,203 @@ T = TypeVar("T")
 if TYPE_CHECKING:
     from autotui.fileio import Format
     from click import Group
+    from .aggregate import Bucket, By, Rollup, Stats
+    from .cache import CachedRows
+    from .schema import ModelSchema
+
+
+class DatafileName(NamedTuple):
+    """
+    A datafile name, parsed into its parts. Datafiles are named
+    {model}-{device}-{YYYY-MM}.{ext} (see Extension.datafile),
+    or {model}-merged.{ext} for merged files
+    """
+
+    name: str
+    model: str
+    # None for merged files
+    device: Optional[str]
+    # (year, month) the file was written in, None for merged
+    # files or any names which don't match the format
+    month: Optional[Tuple[int, int]]
+    ext: str
+
+    @property
+    def merged(self) -> bool:
+        return self.device is None and self.month is None
+
+    def month_range(self) -> Optional[Tuple[datetime, datetime]]:
+        """
+        The start of the month this file was written in, and the start of the next month (local time)
+        """
+        if self.month is None:
+            return None
+        year, month = self.month
+        start = datetime(year, month, 1).astimezone()
+        end = datetime(year + month // 12, month % 12 + 1, 1).astimezone()
+        return start, end
+
+
+def parse_datafile_name(name: str) -> Optional[DatafileName]:
+    """
+    Returns None for hidden files (e.g. temporary files from syncthing)
+    """
+    if name.startswith("."):
+        return None
+    stem, _, ext = name.rpartition(".")
+    if not stem:
+        stem, ext = ext, ""
+    # model names are python identifiers, so can't contain a '-'
+    model, _, rest = stem.partition("-")
+    if rest == "merged":
+        return DatafileName(name, model, None, None, ext)
+    device, month = rest, None
+    # device names can contain '-', so match the date from the right
+    parts = rest.rsplit("-", 2)
+    if (
+        len(parts) == 3
+        and len(parts[1]) == 4
+        and parts[1].isdigit()
+        and len(parts[2]) == 2
+        and parts[2].isdigit()
+        and 1 <= int(parts[2]) <= 12
+    ):
+        device, month = parts[0], (int(parts[1]), int(parts[2]))
+    return DatafileName(name, model, device, month, ext)
+
+
+def _load_yaml(text: str) -> Any:
+    from .flatyaml import load_flat_yaml
+
+    data = load_flat_yaml(text)
+    if data is not None:
+        return data
+
+    import yaml
+
+    # use the libyaml bindings if they're installed
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    return yaml.load(text, Loader=loader)
+
+
+# magic, python version the sidecar was written with, datafile mtime_ns and size
+_SIDECAR_HEADER = struct.Struct("<8sBBqq")
+_SIDECAR_MAGIC = b"TTALLYP1"
+
+
+def _read_sidecar(sidecar: Path, key: Tuple[int, int]) -> Optional[List[Dict[str, Any]]]:
+    import marshal
+
+    try:
+        with sidecar.open("rb") as f:
+            header = f.read(_SIDECAR_HEADER.size)
+            if len(header) != _SIDECAR_HEADER.size:
+                return None
+            magic, major, minor, mtime_ns, size = _SIDECAR_HEADER.unpack(header)
+            if (
+                magic != _SIDECAR_MAGIC
+                or (major, minor) != sys.version_info[:2]
+                or (mtime_ns, size) != key
+            ):
+                return None
+            data = marshal.loads(f.read())
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+    return data if isinstance(data, list) else None
+
+
+def _write_sidecar(sidecar: Path, key: Tuple[int, int], data: List[Dict[str, Any]]) -> None:
+    import marshal
+
+    try:
+        payload = marshal.dumps(data)
+        sidecar.parent.mkdir(parents=True, exist_ok=True)
+        tmp = sidecar.with_name(f".{sidecar.name}.{os.getpid()}.tmp")
+        with tmp.open("wb") as f:
+            f.write(
+                _SIDECAR_HEADER.pack(_SIDECAR_MAGIC, *sys.version_info[:2], *key)
+            )
+            f.write(payload)
+        os.replace(tmp, sidecar)
+    except (OSError, ValueError):
+        # e.g. the cache directory isn't writable, the data
+        # is still loaded, just not saved for next time
+        pass
+
+
+def _load_datafile_blobs(
+    datafile: Path, sidecar: Optional[Path]
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Returns the objects, and whether they were read from the sidecar
+    """
+    key: Optional[Tuple[int, int]] = None
+    try:
+        if sidecar is not None:
+            st = datafile.stat()
+            key = (st.st_mtime_ns, st.st_size)
+            cached = _read_sidecar(sidecar, key)
+            if cached is not None:
+                return cached, True
+        with datafile.open("r") as f:
+            if datafile.suffix == ".json":
+                data = Extension._load_json(f.read())
+            elif datafile.suffix == ".ndjson":
+                # one item per line
+                return [Extension._load_json(line) for line in f if line.strip()], False
+            else:
+                data = _load_yaml(f.read())
+    except FileNotFoundError:
+        return [], False
+    if data is None:
+        return [], False
+    if not isinstance(data, list):
+        raise TypeError(
+            f"{datafile} contains a {type(data).__name__}, expected a top-level list"
+        )
+    if sidecar is not None and key is not None:
+        _write_sidecar(sidecar, key, data)
+    return data, False
+
+
+def load_datafile_blobs(
+    datafile: Path, sidecar: Optional[Path] = None
+) -> List[Dict[str, Any]]:
+    """
+    Load the JSON/YAML objects from a datafile, without converting them to NamedTuples
+
+    If a sidecar path is given, the parsed objects are saved there, and
+    used instead of parsing the datafile again until its mtime/size changes
+
+    This is a module-level function so it can be used in a process pool
+    """
+    return _load_datafile_blobs(datafile, sidecar)[0]
+
+
+def load_json(data: Union[str, bytes]) -> Any:
+    try:
+        # speedup load if orjson is installed
+        import orjson  # type: ignore[import]
+
+        return orjson.loads(data)
+    except ImportError:
+        pass
+    import json
+
+    return json.loads(data)
+
+
+def dump_json(obj: Any) -> str:
+    try:
+        # speedup dump if orjson is installed
+        import orjson  # type: ignore[import]
+
+        return orjson.dumps(obj).decode("utf-8")
+    except ImportError:
+        pass
+    import json
+
+    return json.dumps(obj)
 
 
 def expand_path(pathish: Union[str, Path]) -> Path:
@@ -60,6 +274,17 @@ class Extension:
         # cache/temp dir
         cache_dir: Optional[str] = None,
         cache_dir_envvar: str = "TTALLY_CACHE_DIR",
+        cache_format_envvar: str = "TTALLY_CACHE_FORMAT",
+        # append new items to datafiles instead of rewriting them
+        append_only: Optional[bool] = None,
+        append_envvar: str = "TTALLY_APPEND",
+        # unix socket for 'ttally serve'
+        socket_envvar: str = "TTALLY_SOCKET",
+        # parallel loading
+        parallel: Optional[int] = None,
+        parallel_envvar: str = "TTALLY_PARALLEL",
+        # print timing information to stderr when exiting
+        trace_envvar: str = "TTALLY_TRACE",
         # extensions
         datafile_extension_envvar: str = "TTALLY_EXT",
         default_extension: "Format" = "yaml",
@@ -84,12 +309,6 @@ class Extension:
         )
         self.merged_extension = merged_extension
 
-        # load config
-        self.config_module = self.import_config()
-        assert (
-            self.config_module is not None
-        ), f"{self.config_module} failed to import from {self.config_file}"
-
         # compute data/cache directories
         self.data_dir: Path = (
             expand_path(data_dir)
@@ -102,14 +321,62 @@ class Extension:
             else self.compute_cache_dir(cache_dir_envvar)
         )
 
-        self.hash_file = str(self.cache_dir / "hash.txt")
+        self.cache_format: CacheFormat = self.compute_cache_format(cache_format_envvar)
 
-        self.MODELS: Dict[str, Type[NamedTuple]] = {
+        # if set, new items are appended to YAML datafiles (ndjson datafiles are always appended to)
+        self.append_only: bool = (
+            append_only
+            if append_only is not None
+            else os.environ.get(append_envvar, "").strip().lower()
+            in ("1", "true", "yes")
+        )
+
+        # number of processes to use to parse datafiles, 0 to disable. If not
+        # given, the environment variable is parsed when its first needed
+        self._parallel = parallel
+        self.parallel_envvar = parallel_envvar
+
+        self.socket_path: Path = expand_path(
+            os.environ.get(socket_envvar, str(self.cache_dir / "ttally.sock"))
+        )
+
+        # see ttally/trace.py, also enabled with 'ttally --profile'
+        self.tracer = Tracer(
+            enabled=os.environ.get(trace_envvar, "").strip().lower()
+            in ("1", "true", "yes")
+        )
+
+        self.manifest_file = self.cache_dir / "manifest.json"
+        # (directory mtime, parsed names), see datafile_names
+        self._datafile_names: Optional[Tuple[int, Dict[str, List[DatafileName]]]] = None
+        self.models_index_file = self.cache_dir / "models.json"
+
+    # the configuration is imported lazily, so that commands which
+    # don't need the models (e.g. shell completion) don't pay for it
+
+    @cached_property
+    def config_module(self) -> Any:
+        with self.trace("import_config"):
+            mod = self.import_config()
+        assert mod is not None, f"{mod} failed to import from {self.config_file}"
+        return mod
+
+    @cached_property
+    def MODELS(self) -> Dict[str, Type[NamedTuple]]:
+        models: Dict[str, Type[NamedTuple]] = {
             name.casefold(): klass
             for name, klass in inspect.getmembers(
                 self.config_module, self.__class__._is_model
             )
         }
+        self._write_models_index(models)
+        return models
+
+    def trace(self, phase: str) -> ContextManager[None]:
+        """
+        Time a block of code, if tracing is enabled
+        """
+        return self.tracer.phase(phase)
 
     ############
     #          #
@@ -136,6 +403,86 @@ class Extension:
     def check_import(self) -> None:
         import ttally.config  # noqa
 
+    def _config_mtime(self) -> int:
+        return self.config_file.stat().st_mtime_ns
+
+    def _write_models_index(self, models: Dict[str, Type[NamedTuple]]) -> None:
+        """
+        Save the model names and their schema signatures, so they can be
+        listed/compared to the cache without importing the configuration
+
+        This is called whenever the configuration is imported, so
+        only writes the file if it would change
+        """
+        import json
+
+        try:
+            data = json.dumps(
+                {
+                    "config_file": str(self.config_file),
+                    "mtime": self._config_mtime(),
+                    "models": list(models),
+                    "schemas": {
+                        name: self.schema(nt).signature for name, nt in models.items()
+                    },
+                }
+            )
+            try:
+                if self.models_index_file.read_text() == data:
+                    return
+            except FileNotFoundError:
+                pass
+            tmp = self.models_index_file.with_name(
+                f".{self.models_index_file.name}.{os.getpid()}.tmp"
+            )
+            tmp.write_text(data)
+            os.replace(tmp, self.models_index_file)
+        except OSError:
+            pass
+
+    def _read_models_index(self) -> Optional[Dict[str, Any]]:
+        import json
+
+        try:
+            data = json.loads(self.models_index_file.read_text())
+            if (
+                data["config_file"] == str(self.config_file)
+                and data["mtime"] == self._config_mtime()
+                and isinstance(data["models"], list)
+                and isinstance(data["schemas"], dict)
+            ):
+                return dict(data)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def model_names(self) -> List[str]:
+        """
+        Names of all the models, reads from the saved index if the configuration hasn't
+        changed since it was last imported
+        """
+        if "MODELS" not in self.__dict__:
+            index = self._read_models_index()
+            if index is not None:
+                return list(index["models"])
+        return list(self.MODELS)
+
+    def schema_signatures(
+        self, models: Optional[Dict[str, Type[NamedTuple]]] = None
+    ) -> Dict[str, str]:
+        """
+        The schema signature (see ModelSchema.signature) for each model, reads
+        from the saved index if the configuration hasn't changed since it was last imported
+        """
+        if models is None and "MODELS" not in self.__dict__:
+            index = self._read_models_index()
+            if index is not None:
+                return dict(index["schemas"])
+        return {
+            name: self.schema(nt).signature
+            for name, nt in (models if models is not None else self.MODELS).items()
+        }
+
     @staticmethod
     def _is_model(o: Any) -> bool:
         return inspect.isclass(o) and issubclass(o, tuple) and hasattr(o, "_fields")
@@ -161,7 +508,12 @@ class Extension:
         self._mk_datadir()
 
         f: Path = self.datafile(self.namedtuple_func_name(nt))
-        load_prompt_and_writeback(nt, f)
+        if self.can_append(f):
+            from autotui.namedtuple_prompt import prompt_namedtuple
+
+            self.add_to_datafile([prompt_namedtuple(nt)], f)
+        else:
+            load_prompt_and_writeback(nt, f)
 
     # prompt, but set the datetime for the resulting nametuple to now
     def prompt_now(self, nt: Type[NamedTuple]) -> None:
@@ -171,21 +523,23 @@ class Extension:
 
         # load items from file
         p: Path = self.datafile(self.namedtuple_func_name(nt))
-        load_prompt_and_writeback(nt, p, type_use_values={datetime: datetime.now})
+        if self.can_append(p):
+            from autotui.namedtuple_prompt import prompt_namedtuple
+
+            self.add_to_datafile(
+                [prompt_namedtuple(nt, type_use_values={datetime: datetime.now})], p
+            )
+        else:
+            load_prompt_and_writeback(nt, p, type_use_values={datetime: datetime.now})
 
     # takes one of the models.py and loads all data from it
     def glob_namedtuple(self, nt: Type[NamedTuple]) -> Iterator[NamedTuple]:
-        from autotui.shortcuts import load_from
-        from itertools import chain
-
         self._mk_datadir()
 
-        yield from chain(
-            *map(
-                lambda p: load_from(nt, p, allow_empty=True),
-                self.glob_datafiles(self.namedtuple_func_name(nt)),
-            )
-        )
+        for items in self.load_datafiles(
+            nt, sorted(self.glob_datafiles(self.namedtuple_func_name(nt)))
+        ):
+            yield from items
 
     # used in __main__.py for the from_json command
     def save_from(
@@ -193,11 +547,9 @@ class Extension:
     ) -> None:
         from autotui.namedtuple_prompt import prompt_namedtuple
         from autotui.fileio import namedtuple_sequence_loads
-        from autotui.shortcuts import load_from, dump_to
 
         json_text: str = use_input.read()
         p = self.datafile(self.namedtuple_func_name(nt))
-        items: List[NamedTuple] = load_from(nt, p, allow_empty=True)
         new_items: List[NamedTuple] = []
         if partial:
             # load the list as json blobs
@@ -211,8 +563,82 @@ class Extension:
                 new_items.append(new_nt)
         else:
             new_items.extend(namedtuple_sequence_loads(json_text, nt))
-        items.extend(new_items)
-        dump_to(items, p)
+        self.add_to_datafile(new_items, p)
+
+    def can_append(self, datafile: Path) -> bool:
+        """
+        Whether new items can be appended to this datafile, instead of rewriting it
+        """
+        if datafile.suffix == ".ndjson":
+            return True
+        if not self.append_only or datafile.suffix not in (".yaml", ".yml"):
+            return False
+        try:
+            with datafile.open("rb") as f:
+                start = f.read(2)
+        except FileNotFoundError:
+            return True
+        # empty, or a block-style YAML list (what autotui writes),
+        # which can be continued by appending more list items
+        return start in (b"", b"- ", b"-\n")
+
+    def add_to_datafile(self, new_items: List[NamedTuple], datafile: Path) -> None:
+        """
+        Add items to a datafile
+
+        If possible, the new items are serialized and appended to the end of
+        the file with a single write, so existing items are never rewritten.
+        Otherwise, this loads the file and writes it back with the new items
+        """
+        if len(new_items) == 0:
+            return
+        if not self.can_append(datafile):
+            items = self.load_datafile(type(new_items[0]), datafile)
+            items.extend(new_items)
+            self.dump_datafile(items, datafile)
+            return
+
+        if datafile.suffix == ".ndjson":
+            schema = self.schema(type(new_items[0]))
+            chunk = "".join(
+                f"{self._dump_json(schema.serialize(o))}\n" for o in new_items
+            )
+        else:
+            from autotui.fileio import namedtuple_sequence_dumps
+
+            chunk = namedtuple_sequence_dumps(new_items, format="yaml")
+
+        fd = os.open(datafile, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # make sure the new items start on a new line
+            size = os.fstat(fd).st_size
+            if size > 0 and os.pread(fd, 1, size - 1) != b"\n":
+                chunk = f"\n{chunk}"
+            data = chunk.encode("utf-8")
+            while data:
+                data = data[os.write(fd, data) :]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def load_datafile(self, nt: Type[NamedTuple], datafile: Path) -> List[NamedTuple]:
+        schema = self.schema(nt)
+        blobs = self.load_datafile_blobs(datafile)
+        with self.trace("deserialize"):
+            return schema.deserialize_many(blobs)
+
+    def dump_datafile(self, items: List[NamedTuple], datafile: Path) -> None:
+        if datafile.suffix == ".ndjson":
+            # serialize before opening the file, so errors don't cause data loss
+            data = "".join(
+                f"{self._dump_json(self.schema(type(o)).serialize(o))}\n"
+                for o in items
+            )
+            datafile.write_text(data)
+        else:
+            from autotui.shortcuts import dump_to
+
+            dump_to(items, datafile)
 
     #############
     #           #
@@ -245,6 +671,26 @@ class Extension:
             p.mkdir()
         return p
 
+    @property
+    def parallel(self) -> int:
+        if self._parallel is None:
+            self._parallel = self.compute_parallel(self.parallel_envvar)
+        return self._parallel
+
+    def compute_parallel(self, envvar: str) -> int:
+        val = os.environ.get(envvar, "0").strip().lower()
+        if val == "auto":
+            return os.cpu_count() or 1
+        try:
+            return int(val)
+        except ValueError:
+            import warnings
+
+            warnings.warn(
+                f"Expected a number of processes or 'auto' for ${envvar}, got '{val}', parsing datafiles sequentially"
+            )
+            return 0
+
     def ttally_merged_path(self, model: str) -> Path:
         return self.data_dir / f"{model}-merged.{self.merged_extension}"
 
@@ -259,11 +705,186 @@ class Extension:
             / f"{for_function}-{self.versioned_timestamp()}.{self.extension}"
         )
 
+    def datafile_names(self) -> Dict[str, List[DatafileName]]:
+        """
+        Parses the names of all the files in the data directory, grouped by model
+
+        This is saved, and only listed again if the mtime of the data
+        directory changes, so all models share one scan of the directory
+        """
+        dir_mtime_ns = os.stat(self.data_dir).st_mtime_ns
+        if self._datafile_names is not None and self._datafile_names[0] == dir_mtime_ns:
+            return self._datafile_names[1]
+        listed_ns = time.time_ns()
+        by_model: Dict[str, List[DatafileName]] = {}
+        with self.trace("list_datafiles"), os.scandir(self.data_dir) as it:
+            for entry in it:
+                parsed = parse_datafile_name(entry.name)
+                if parsed is not None and entry.is_file():
+                    by_model.setdefault(parsed.model, []).append(parsed)
+        for names in by_model.values():
+            names.sort()
+        # if the directory was modified right before it was listed, another change
+        # in the same timestamp tick wouldn't change the mtime, so don't reuse this
+        if listed_ns - dir_mtime_ns > 2_000_000_000:
+            self._datafile_names = (dir_mtime_ns, by_model)
+        return by_model
+
     # globs all datafiles for some for_function
     def glob_datafiles(self, for_function: str) -> Iterator[Path]:
-        for f in os.listdir(self.data_dir):
-            if f.startswith(for_function):
-                yield self.data_dir / f
+        for d in self.datafile_names().get(for_function, []):
+            yield self.data_dir / d.name
+
+    def prune_datafiles(
+        self,
+        model: str,
+        datafiles: List[Path],
+        *,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[Path]:
+        """
+        Remove any datafiles which can't have items from since (inclusive) to until (exclusive)
+
+        If a file hasn't changed since it was cached, this uses the min/max datetime
+        of its items saved in the cache index. Otherwise, it uses the month in the
+        filename, which is the month the file was written in. Since items can be
+        added with earlier dates, that can only skip files written before 'since'
+        """
+        if since is None and until is None:
+            return datafiles
+        index = self._read_datafile_index(model)
+        kept: List[Path] = []
+        for datafile in datafiles:
+            entry = index.get(datafile.name)
+            if entry is not None and len(entry) == 4:
+                try:
+                    current = self.__class__.datafile_key(datafile)
+                except FileNotFoundError:
+                    continue
+                if entry[:2] == current:
+                    lo, hi = entry[2], entry[3]
+                    if lo is None or hi is None:
+                        continue
+                    if since is not None and hi < since.timestamp():
+                        continue
+                    if until is not None and lo >= until.timestamp():
+                        continue
+                    kept.append(datafile)
+                    continue
+            if since is not None:
+                parsed = parse_datafile_name(datafile.name)
+                months = parsed.month_range() if parsed is not None else None
+                # allow a day, in case the file was written on a device in another timezone
+                if months is not None and months[1] + timedelta(days=1) <= since:
+                    continue
+            kept.append(datafile)
+        return kept
+
+    def models_for_datafiles(self, names: Iterable[str]) -> Set[str]:
+        """
+        Returns the models which these datafile names belong to
+        """
+        models = set(self.model_names())
+        return {
+            parsed.model
+            for parsed in map(parse_datafile_name, names)
+            if parsed is not None and parsed.model in models
+        }
+
+    def datafile_months(self, model: str) -> Optional[Tuple[datetime, datetime]]:
+        """
+        The range of months covered by the (non-merged) datafiles for this model,
+        from the start of the first month to the end of the last month
+        """
+        ranges = [
+            r
+            for r in (d.month_range() for d in self.datafile_names().get(model, []))
+            if r is not None
+        ]
+        if not ranges:
+            return None
+        return min(r[0] for r in ranges), max(r[1] for r in ranges)
+
+    def load_datafile_blobs(self, datafile: Path) -> List[Dict[str, Any]]:
+        """
+        Load the JSON/YAML objects from a datafile, without converting them to NamedTuples
+        """
+        sidecar = self.datafile_sidecar(datafile)
+        with self.trace("parse_datafiles"):
+            blobs, sidecar_hit = _load_datafile_blobs(datafile, sidecar)
+        self.tracer.count("datafiles_parsed")
+        self.tracer.count("items_parsed", len(blobs))
+        if sidecar is not None:
+            self.tracer.count("sidecar_hit" if sidecar_hit else "sidecar_miss")
+        return blobs
+
+    def datafile_sidecar(self, datafile: Path) -> Optional[Path]:
+        """
+        Where to save the parsed items from a YAML datafile, so it doesn't
+        have to be parsed again. Only used for datafiles from previous months,
+        which aren't written to anymore (and so their mtime rarely changes)
+        """
+        if datafile.suffix not in (".yaml", ".yml"):
+            return None
+        parsed = parse_datafile_name(datafile.name)
+        if parsed is None or parsed.month is None:
+            return None
+        now = datetime.now()
+        if parsed.month >= (now.year, now.month):
+            return None
+        return self.cache_dir / "parsed" / f"{datafile.name}.marshal"
+
+    def load_datafiles(
+        self, nt: Type[NamedTuple], datafiles: List[Path]
+    ) -> Iterator[List[NamedTuple]]:
+        """
+        Yields the items from each datafile, in the same order as datafiles
+
+        If parallel loading is enabled, the files are parsed across a
+        process pool, and then converted to NamedTuples in this process
+        """
+        if self.parallel > 1 and len(datafiles) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            schema = self.schema(nt)
+            with ProcessPoolExecutor(
+                max_workers=min(self.parallel, len(datafiles))
+            ) as executor:
+                # map returns results in the order they were submitted
+                sidecars = [self.datafile_sidecar(d) for d in datafiles]
+                results = executor.map(load_datafile_blobs, datafiles, sidecars)
+                while True:
+                    # the time spent waiting for the workers to parse each file
+                    with self.trace("parse_datafiles"):
+                        blobs = next(results, None)
+                    if blobs is None:
+                        break
+                    self.tracer.count("datafiles_parsed")
+                    self.tracer.count("items_parsed", len(blobs))
+                    with self.trace("deserialize"):
+                        items = schema.deserialize_many(blobs)
+                    yield items
+        else:
+            for p in datafiles:
+                yield self.load_datafile(nt, p)
+
+    def glob_blobs(
+        self,
+        nt: Type[NamedTuple],
+        *,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Load the raw objects from each datafile. If since/until are given,
+        skips any files which can't have items in that range (the items
+        themselves still need to be filtered)
+        """
+        model = self.namedtuple_func_name(nt)
+        datafiles = list(self.glob_datafiles(model))
+        for p in self.prune_datafiles(model, datafiles, since=since, until=until):
+            yield from self.load_datafile_blobs(p)
 
     def temp_dir(self) -> Path:
         from tempfile import gettempdir
@@ -298,7 +919,7 @@ class Extension:
     def generate_shell_aliases(self, python_loc: str = "python3") -> Iterator[str]:
         pre = f"'{python_loc} -m ttally "
         suf = "'"
-        for mname in self.MODELS.keys():
+        for mname in self.model_names():
             yield f"alias {mname}={pre}prompt {mname}{suf}"
             yield f"alias {mname}-now={pre}prompt-now {mname}{suf}"
             yield f"alias {mname}-recent={pre}recent {mname}{suf}"
@@ -309,6 +930,15 @@ class Extension:
     #          #
     ############
 
+    @classmethod
+    def schema(cls, nt: Type[NamedTuple]) -> "ModelSchema":
+        """
+        The fields/types/datetime attribute for a model, computed once per model
+        """
+        from .schema import model_schema
+
+        return model_schema(nt)
+
     @classmethod
     def namedtuple_extract_from_annotation(
         cls, nt: Type[NamedTuple], _type: Any
@@ -319,34 +949,78 @@ class Extension:
         >>> namedtuple_extract_from_annotation(Test, datetime)
         'something'
         """
-        import inspect
-        from autotui.typehelpers import resolve_annotation_single
-
-        for attr_name, param in inspect.signature(nt).parameters.items():
-            # Optional[(<class 'int'>, False)]
-            attr_type, _ = resolve_annotation_single(param.annotation)
-
-            if attr_type == _type:
-                return attr_name
-        raise TypeError(f"Could not find {_type} on {nt}")
+        attr_name = cls.schema(nt).find_attr(_type)
+        if attr_name is None:
+            raise TypeError(f"Could not find {_type} on {nt}")
+        return attr_name
 
     @classmethod
     def _extract_dt_from(cls, nt: Type[NamedTuple]) -> Callable[[NamedTuple], datetime]:
         # returns a function, when which given an item of this
         # type, returns the datetime value
-        dt_attr: str = cls.namedtuple_extract_from_annotation(nt, datetime)
-        return lambda o: getattr(o, dt_attr)  # type: ignore[no-any-return]
+        return cls.schema(nt).key
 
     def glob_namedtuple_by_datetime(
         self,
         nt: Type[NamedTuple],
         reverse: bool = False,
     ) -> List[NamedTuple]:
-        return sorted(
-            self.glob_namedtuple(nt),
-            key=self._extract_dt_from(nt),
-            reverse=reverse,
-        )
+        key = self.schema(nt).key
+
+        # if a subclass changed how items are loaded, respect that
+        if type(self).glob_namedtuple is not Extension.glob_namedtuple:
+            return sorted(self.glob_namedtuple(nt), key=key, reverse=reverse)
+
+        import heapq
+
+        # each datafile is mostly in order already, so sort each of
+        # them and then merge the sorted runs
+        self._mk_datadir()
+        runs = []
+        for items in self.load_datafiles(
+            nt, sorted(self.glob_datafiles(self.namedtuple_func_name(nt)))
+        ):
+            with self.trace("sort"):
+                runs.append(sorted(items, key=key, reverse=reverse))
+        with self.trace("sort"):
+            return list(heapq.merge(*runs, key=key, reverse=reverse))
+
+    def iter_newest(self, nt: Type[NamedTuple]) -> Iterator[NamedTuple]:
+        """
+        Yields the items for a model, newest first
+
+        If the cache is up to date, this reads it backwards and deserializes the
+        items in increasingly large chunks, so if only the first few items are
+        used, the rest are never read. This doesn't use the daemon, which
+        would have to send every item before the first one could be used
+        """
+        from itertools import islice
+
+        model = self.namedtuple_func_name(nt)
+        schema = self.schema(nt)
+        try:
+            cf = self._fresh_cache_file(model=model)
+        except RuntimeError:
+            yield from self.glob_namedtuple_by_datetime(nt, reverse=True)
+            return
+        rows: Iterator[Dict[str, Any]]
+        if self.cache_format == "columnar":
+            from .cache import ColumnarCache, iter_rows_newest
+
+            rows = iter_rows_newest(ColumnarCache(cf))
+        else:
+            from .cache import iter_json_cache_newest
+
+            rows = iter_json_cache_newest(cf)
+        chunk = 64
+        while True:
+            blobs = list(islice(rows, chunk))
+            if not blobs:
+                return
+            with self.trace("deserialize"):
+                items = schema.deserialize_many(blobs)
+            yield from items
+            chunk = min(chunk * 4, 16384)
 
     def take_items(
         self,
@@ -358,8 +1032,8 @@ class Extension:
         Helper methods to take the first N items from a list, or
         the first N items from a list which are within a timedelta
 
-        This works for both cached and uncached data (by just
-        checking the types at runtime)
+        The items should be sorted newest first. This works for both
+        cached (dicts) and uncached (NamedTuples) data
         """
         if len(items) == 0:
             return items
@@ -375,31 +1049,86 @@ class Extension:
             else:
                 nt_type = nt
 
-            dt_attr = self.namedtuple_extract_from_annotation(nt_type, datetime)
-            now = datetime.now().timestamp()
-
-            def accessor(o: T) -> float:
-                data: Union[int, datetime]
-                if isinstance(o, dict):
-                    data = o[dt_attr]
-                else:
-                    data = getattr(o, dt_attr)
-                if isinstance(data, datetime):
-                    return data.timestamp()
+            dt_attr = self.schema(nt_type).dt_attr
+            # check the type once, instead of for each item
+            is_dict = isinstance(items[0], dict)
+
+            def accessor(o: Any) -> float:
+                if is_dict:
+                    return o[dt_attr]  # type: ignore[no-any-return]
+                return getattr(o, dt_attr).timestamp()  # type: ignore[no-any-return]
+
+            # the items in the range are a prefix of the list,
+            # so binary search for the first one which is too old
+            after = datetime.now().timestamp() - count.total_seconds()
+            lo, hi = 0, len(items)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if accessor(items[mid]) >= after:
+                    lo = mid + 1
                 else:
-                    assert isinstance(data, (int, float))
-                    return data
-
-            total = count.total_seconds()
-            return [i for i in items if now - accessor(i) <= total]
+                    hi = mid
+            return items[:lo]
 
     def query_recent(
-        self, nt: Type[NamedTuple], count: Union[int, timedelta, Literal["all"]]
+        self,
+        nt: Type[NamedTuple],
+        count: Union[int, timedelta, Literal["all"]],
+        *,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
     ) -> List[NamedTuple]:
         """query the module for recent entries (based on datetime) from a namedtuple"""
 
-        items_itr = self.glob_namedtuple_by_datetime(nt, reverse=True)
-        return self.take_items(list(items_itr), count, nt)
+        # if a subclass changed how items are loaded, the raw
+        # objects can't be used, so load/sort everything
+        if (count == "all" and since is None and until is None) or (
+            type(self).glob_namedtuple is not Extension.glob_namedtuple
+        ):
+            items = self.glob_namedtuple_by_datetime(nt, reverse=True)
+            if since is not None or until is not None:
+                key = self.schema(nt).key
+                items = [
+                    o
+                    for o in items
+                    if (since is None or key(o) >= since)
+                    and (until is None or key(o) < until)
+                ]
+            return self.take_items(items, count, nt)
+
+        import heapq
+
+        # select the newest items from the raw JSON/YAML objects, so that only
+        # the items which are going to be printed are converted to NamedTuples.
+        # this matches how autotui deserializes datetimes (from epoch seconds)
+        schema = self.schema(nt)
+        _epoch = schema.epoch
+
+        self._mk_datadir()
+
+        if isinstance(count, timedelta):
+            after = datetime.now().astimezone() - count
+            since = after if since is None else max(since, after)
+
+        blobs = self.glob_blobs(nt, since=since, until=until)
+        if since is not None or until is not None:
+            lo = since.timestamp() if since is not None else None
+            hi = until.timestamp() if until is not None else None
+            blobs = (
+                o
+                for o in blobs
+                if (lo is None or _epoch(o) >= lo) and (hi is None or _epoch(o) < hi)
+            )
+
+        newest: List[Dict[str, Any]]
+        # this includes parsing the datafiles, since blobs is a generator
+        with self.trace("select_recent"):
+            if isinstance(count, int):
+                newest = heapq.nlargest(count, blobs, key=_epoch)
+            else:
+                newest = sorted(blobs, key=_epoch, reverse=True)
+        with self.trace("deserialize"):
+            return schema.deserialize_many(newest)
 
     def query_print(
         self,
@@ -409,13 +1138,17 @@ class Extension:
         output_format: Literal["json", "table"] = "table",
         cached_data: Optional[List[NamedTuple]] = None,
         human_readable: bool = False,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
     ) -> None:
         import more_itertools
 
         # assumes that there is a datetime attribute on this, else
         # we have nothing to sort by
         if cached_data is None:
-            res = more_itertools.peekable(iter(self.query_recent(nt, count)))
+            res = more_itertools.peekable(
+                iter(self.query_recent(nt, count, since=since, until=until))
+            )
         else:
             if count == "all":
                 count = len(cached_data)
@@ -425,9 +1158,8 @@ class Extension:
         except StopIteration:
             # no items, so just exit
             return
-        dt_attr: str = self.namedtuple_extract_from_annotation(
-            first_item.__class__, datetime
-        )
+        schema = self.schema(type(first_item))
+        dt_attr = schema.dt_attr
 
         def _serialize_datetime(dt: datetime) -> str:
             if human_readable:
@@ -443,38 +1175,36 @@ class Extension:
                     )
             return str(dt.astimezone().replace(tzinfo=None))
 
-        if output_format == "json":
-            import json
-            from autotui.serialize import serialize_namedtuple
-
-            for o in res:
-                # convert any other fields to json-compatible types
-                s = serialize_namedtuple(o)
-                sys.stdout.write(
-                    json.dumps(
-                        {
-                            dt_attr: _serialize_datetime(getattr(o, dt_attr)),
-                            # keep any other fields we want
-                            **{
-                                k: s[k]
-                                for k in o._fields
-                                if k != dt_attr and k not in remove_attrs
+        with self.trace("print"):
+            if output_format == "json":
+                import json
+
+                for o in res:
+                    # convert any other fields to json-compatible types
+                    s = schema.serialize(o)
+                    sys.stdout.write(
+                        json.dumps(
+                            {
+                                dt_attr: _serialize_datetime(getattr(o, dt_attr)),
+                                # keep any other fields we want
+                                **{
+                                    k: s[k]
+                                    for k in schema.fields
+                                    if k != dt_attr and k not in remove_attrs
+                                },
                             },
-                        },
-                        separators=(",", ":"),
-                    ),
-                )
-                sys.stdout.write("\n")
-        else:
-            # get non-datetime attr names, if they're not filtered
-            other_attrs: List[str] = [
-                k
-                for k in first_item._asdict().keys()
-                if k != dt_attr and k not in remove_attrs
-            ]
-            for o in res:
-                print(_serialize_datetime(getattr(o, dt_attr)), end="\t")
-                print("\t".join([str(getattr(o, a)) for a in other_attrs]))
+                            separators=(",", ":"),
+                        ),
+                    )
+                    sys.stdout.write("\n")
+            else:
+                # get non-datetime attr names, if they're not filtered
+                other_attrs: List[str] = [
+                    k for k in schema.fields if k != dt_attr and k not in remove_attrs
+                ]
+                for o in res:
+                    print(_serialize_datetime(getattr(o, dt_attr)), end="\t")
+                    print("\t".join([str(getattr(o, a)) for a in other_attrs]))
 
     ###########
     #         #
@@ -494,62 +1224,246 @@ class Extension:
             ttally_cache_dir.mkdir(parents=True)
         return ttally_cache_dir
 
-    def file_hash(self, *, model: str) -> str:
+    def compute_cache_format(self, envvar: str) -> CacheFormat:
+        fmt = os.environ.get(envvar, "json").strip().lower()
+        if fmt not in ("json", "columnar"):
+            raise ValueError(
+                f"Unknown cache format '{fmt}' from ${envvar}, expected 'json' or 'columnar'"
+            )
+        return cast(CacheFormat, fmt)
+
+    def scan_datafiles(self) -> Tuple[int, DatafileIndex]:
+        """
+        Returns the mtime_ns of the data directory, and the [mtime_ns, size] of
+        each file in it, in a single pass over the directory using os.scandir
+        """
+        dir_mtime_ns = os.stat(self.data_dir).st_mtime_ns
+        files: DatafileIndex = {}
+        with os.scandir(self.data_dir) as it:
+            for entry in it:
+                if entry.is_file():
+                    st = entry.stat()
+                    files[entry.name] = [st.st_mtime_ns, st.st_size]
+        return dir_mtime_ns, files
+
+    @staticmethod
+    def _model_files(model: str, files: DatafileIndex) -> DatafileIndex:
+        matched: DatafileIndex = {}
+        for name, key in files.items():
+            parsed = parse_datafile_name(name)
+            if parsed is not None and parsed.model == model:
+                matched[name] = key
+        return matched
+
+    @staticmethod
+    def _files_hash(files: DatafileIndex) -> str:
+        return "|".join(f"{name}:{k[0]}:{k[1]}" for name, k in sorted(files.items()))
+
+    def file_hash(self, *, model: str, files: Optional[DatafileIndex] = None) -> str:
         """
         A unique representation of the current files/timestamp for a model
         """
-        files = list(self.glob_datafiles(model))
-        files_stat = [(f, f.stat().st_mtime) for f in files]
-        files_stat.sort(key=lambda t: t[1])
-        return "|".join(f"{f}:{st}" for (f, st) in files_stat)
+        if files is None:
+            _, files = self.scan_datafiles()
+        return self.__class__._files_hash(self.__class__._model_files(model, files))
 
     def file_hashes(
         self,
         *,
         models: Optional[Dict[str, Type[NamedTuple]]] = None,
         for_models: Optional[Set[str]] = None,
+        files: Optional[DatafileIndex] = None,
     ) -> FileHashes:
-        if models is None:
-            models = self.MODELS
-        if for_models:
-            return {
-                model: self.file_hash(model=model)
-                for model in models
-                if model in for_models
+        if files is None:
+            _, files = self.scan_datafiles()
+        names = list(models) if models is not None else self.model_names()
+        return {
+            model: self.file_hash(model=model, files=files)
+            for model in names
+            if not for_models or model in for_models
+        }
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        """
+        JSON file, for each model saves the [mtime_ns, size] of its datafiles
+        when its cache was written, the mtime of the data directory and the
+        schema signature of the model:
+
+        {"model_name": {"dir_mtime_ns": ..., "scanned_ns": ..., "schema": ..., "files": {"name": [mtime_ns, size]}}}
+        """
+        try:
+            data = self.__class__._load_json(self.manifest_file.read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        # NOTE: if two processes update this at the same time, one of the
+        # updates could be lost. However, that would only mean the cache
+        # is considered stale and rebuilt, nothing should fatally error
+        tmp = self.manifest_file.with_name(f".{self.manifest_file.name}.{os.getpid()}")
+        tmp.write_text(self.__class__._dump_json(manifest))
+        os.replace(tmp, self.manifest_file)
+
+    def save_manifest(
+        self,
+        *,
+        models: Iterable[str],
+        dir_mtime_ns: int,
+        scanned_ns: int,
+        files: DatafileIndex,
+        signatures: Dict[str, str],
+    ) -> None:
+        """
+        Update the manifest for these models, leaving any others as they were
+
+        files/dir_mtime_ns are from scan_datafiles, and scanned_ns is the time
+        right before the scan
+        """
+        manifest = self._read_manifest()
+        for model in models:
+            manifest[model] = {
+                "dir_mtime_ns": dir_mtime_ns,
+                "scanned_ns": scanned_ns,
+                "schema": signatures.get(model),
+                "files": self.__class__._model_files(model, files),
             }
-        else:
-            return {model: self.file_hash(model=model) for model in models}
+        self._write_manifest(manifest)
 
-    def _read_hash(self) -> Optional[FileHashes]:
+    def _maybe_written_in_place(
+        self, datafiles: Iterable[str], checked_ns: Optional[int] = None
+    ) -> List[str]:
         """
-        Plaintext file, looks like:
+        Datafiles which can be written to without changing the mtime of the
+        data directory: the current and previous months datafiles (new items
+        are added to these, and the last write to the previous months file
+        could be right before the month changed) and merged files
 
-        model_name:hash
-        model_name:hash
-        model_name:hash
+        If checked_ns (when the datafiles were last checked) is given, also
+        includes the datafiles for every month since then
         """
+        now = datetime.now()
+        start = datetime(now.year, now.month, 1) - timedelta(days=1)
+        if checked_ns is not None:
+            start = min(start, datetime.fromtimestamp(checked_ns / 1e9))
+        months: List[str] = []
+        year, month = start.year, start.month
+        while (year, month) <= (now.year, now.month):
+            months.append(f"-{year:04d}-{month:02d}.")
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return [
+            d
+            for d in datafiles
+            if "-merged." in d or any(month in d for month in months)
+        ]
+
+    def _unchanged_since_manifest(self, entry: Dict[str, Any], dir_mtime_ns: int) -> bool:
+        """
+        Check if a models datafiles are still the same as in the manifest, without scanning
+        the data directory
 
-        data = {}
-        try:
-            with open(self.hash_file, "r") as f:
-                for line in f:
-                    ls = line.strip()
-                    if not ls:
-                        continue
-                    model, hash_ = ls.split(":", maxsplit=1)
-                    data[model] = hash_
-        except FileNotFoundError:
-            pass
-        return data
+        If the directory mtime hasn't changed, no files were added/removed/renamed (which is
+        how syncthing and most editors save files). Files which are written to in place don't
+        change the directory mtime, so those are still checked
+        """
+        if entry.get("dir_mtime_ns") != dir_mtime_ns:
+            return False
+        # if the directory was modified right before it was scanned, another change
+        # during the same timestamp tick wouldn't change the mtime (like gits 'racy clean' check)
+        if entry.get("scanned_ns", 0) - dir_mtime_ns < 2_000_000_000:
+            return False
+        files: DatafileIndex = entry.get("files", {})
+        for name in self._maybe_written_in_place(files, entry.get("scanned_ns")):
+            try:
+                if self.__class__.datafile_key(self.data_dir / name) != files[name]:
+                    return False
+            except FileNotFoundError:
+                return False
+        return True
+
+    def _model_is_stale(
+        self,
+        model: str,
+        current_hash: str,
+        manifest: Dict[str, Any],
+        signature: Optional[str],
+    ) -> bool:
+        return (
+            model not in manifest
+            or current_hash
+            != self.__class__._files_hash(manifest[model].get("files", {}))
+            # the model was changed, so the cached items have the wrong fields
+            or manifest[model].get("schema") != signature
+            # e.g. if the cache format changed
+            or not self.cache_file(model).exists()
+        )
+
+    def stale_models(
+        self,
+        *,
+        hashes: Optional[FileHashes] = None,
+        for_models: Optional[Set[str]] = None,
+        models: Optional[Dict[str, Type[NamedTuple]]] = None,
+    ) -> List[str]:
+        """
+        Returns the names of any models whose cache doesn't match the current datafiles
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        manifest = self._read_manifest()
+        signatures = self.schema_signatures(models)
+
+        if hashes is not None:
+            return [
+                model
+                for model, current_hash in hashes.items()
+                if not (for_models and model not in for_models)
+                and self._model_is_stale(
+                    model, current_hash, manifest, signatures.get(model)
+                )
+            ]
 
-    def _write_hash(self, hashes: FileHashes) -> None:
-        # NOTE: there is a possibility for a race condition here,
-        # if another process reads while this is writing. However, that would
-        # only invalidate the cache, so it would just mean we hit
-        # the slow route, nothing should fatally error
-        with open(self.hash_file, "w") as f:
-            for model, hash_ in hashes.items():
-                f.write(f"{model}:{hash_}\n")
+        names = list(models) if models is not None else self.model_names()
+        check = [m for m in names if not (for_models and m not in for_models)]
+
+        # fast path, a single stat of the data directory
+        dir_mtime_ns = os.stat(self.data_dir).st_mtime_ns
+        check = [
+            m
+            for m in check
+            if not (
+                m in manifest
+                and manifest[m].get("schema") == signatures.get(m)
+                and self.cache_file(m).exists()
+                and self._unchanged_since_manifest(manifest[m], dir_mtime_ns)
+            )
+        ]
+        if not check:
+            return []
+
+        # directory has changed, compare each datafile
+        scanned_ns = time.time_ns()
+        dir_mtime_ns, files = self.scan_datafiles()
+        stale: List[str] = []
+        unchanged: List[str] = []
+        for model in check:
+            current_hash = self.file_hash(model=model, files=files)
+            if self._model_is_stale(
+                model, current_hash, manifest, signatures.get(model)
+            ):
+                stale.append(model)
+            else:
+                unchanged.append(model)
+        # the directory changed, but not the datafiles for these models. save the
+        # current directory mtime, so the next check can use the fast path
+        if unchanged:
+            self.save_manifest(
+                models=unchanged,
+                dir_mtime_ns=dir_mtime_ns,
+                scanned_ns=scanned_ns,
+                files=files,
+                signatures=signatures,
+            )
+        return stale
 
     def cache_is_stale(
         self,
@@ -558,63 +1472,375 @@ class Extension:
         for_models: Optional[Set[str]] = None,
         models: Optional[Dict[str, Type[NamedTuple]]] = None,
     ) -> bool:
-        cache_stale = False
-        if models is None:
-            models = self.MODELS
+        return (
+            len(self.stale_models(hashes=hashes, for_models=for_models, models=models))
+            > 0
+        )
 
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
+    def cache_file(self, model: str, cache_format: Optional[CacheFormat] = None) -> Path:
+        if (cache_format or self.cache_format) == "columnar":
+            return self.cache_dir / f"{model}-cache.col"
+        return self.cache_dir / f"{model}-cache.json"
+
+    def datafile_cache_dir(self, model: str) -> Path:
+        return self.cache_dir / "files" / model
+
+    def datafile_cache_file(self, model: str, datafile: Path) -> Path:
+        # the items in each datafile are serialized for a particular model,
+        # so these are saved separately for each model
+        return self.datafile_cache_dir(model) / f"{datafile.name}.json"
+
+    def datafile_index_file(self, model: str) -> Path:
+        return self.cache_dir / f"{model}-files.json"
+
+    @classmethod
+    def datafile_key(cls, datafile: Path) -> DatafileKey:
+        st = datafile.stat()
+        return [st.st_mtime_ns, st.st_size]
+
+    def _read_datafile_index(
+        self, model: str, signature: Optional[str] = None
+    ) -> DatafileCacheIndex:
+        """
+        JSON file, maps each datafile name for a model to the [mtime_ns, size]
+        it had when its cache file was written, and the min/max epoch of its items:
+
+        {"schema": ..., "files": {"name": [mtime_ns, size, min, max]}}
+
+        If a schema signature is given and the files were cached with a different
+        one, the cache files have the wrong fields, so this returns nothing
+        """
+        try:
+            data = self.__class__._load_json(self.datafile_index_file(model).read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+        if not isinstance(data, dict) or not isinstance(data.get("files"), dict):
+            return {}
+        if signature is not None and data.get("schema") != signature:
+            return {}
+        files: DatafileCacheIndex = data["files"]
+        return files
+
+    def _write_datafile_index(
+        self, model: str, index: DatafileCacheIndex, signature: str
+    ) -> None:
+        import json
+
+        self.datafile_index_file(model).write_text(
+            json.dumps({"schema": signature, "files": index})
+        )
+
+    def sorted_datafile_exports(
+        self, nt: Type[NamedTuple], datafile: Path
+    ) -> List[Dict[str, Any]]:
+        """
+        Load one datafile, returning the serialized items sorted by datetime
+        """
+        return self._sorted_exports(nt, self.load_datafile(nt, datafile))
+
+    def _sorted_exports(
+        self, nt: Type[NamedTuple], items: List[NamedTuple]
+    ) -> List[Dict[str, Any]]:
+        schema = self.schema(nt)
+        return [schema.serialize(o) for o in sorted(items, key=schema.key)]
+
+    def sorted_model_exports(
+        self, *, model: str, nt: Type[NamedTuple]
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns the serialized items for a model, sorted by datetime
+
+        Each datafile has its own sorted cache file, which is reused as long
+        as the datafile's mtime and size haven't changed. Only datafiles which
+        have changed are parsed again, the per-file results are then merged
+        """
+        import heapq
+
+        self.datafile_cache_dir(model).mkdir(parents=True, exist_ok=True)
+
+        schema = self.schema(nt)
+        dt_attr = schema.dt_attr
+        old_index = self._read_datafile_index(model, schema.signature)
+        new_index: DatafileCacheIndex = {}
+        runs: Dict[Path, List[Dict[str, Any]]] = {}
+        changed: List[Path] = []
+        keys: Dict[Path, DatafileKey] = {}
+        datafiles: List[Path] = []
+        for datafile in sorted(self.glob_datafiles(model)):
+            try:
+                key = keys[datafile] = self.datafile_key(datafile)
+            except FileNotFoundError:
+                # removed since it was listed (e.g. by 'merge' or syncing)
+                continue
+            datafiles.append(datafile)
+            old = old_index.get(datafile.name)
+            if old is not None and old[:2] == key and len(old) == 4:
+                try:
+                    runs[datafile] = self.__class__._load_json(
+                        self.datafile_cache_file(model, datafile).read_text()
+                    )
+                    new_index[datafile.name] = old
+                    self.tracer.count("datafile_cache_hit")
+                    continue
+                except (FileNotFoundError, ValueError):
+                    pass
+            changed.append(datafile)
+            self.tracer.count("datafile_cache_miss")
+
+        # parse any datafiles which changed (possibly in parallel)
+        for datafile, items in zip(changed, self.load_datafiles(nt, changed)):
+            run = self._sorted_exports(nt, items)
+            self.datafile_cache_file(model, datafile).write_text(
+                self.__class__._dump_json(run)
+            )
+            runs[datafile] = run
+            # save the range of datetimes in this file, used by prune_datafiles
+            new_index[datafile.name] = [
+                *keys[datafile],
+                run[0][dt_attr] if run else None,
+                run[-1][dt_attr] if run else None,
+            ]
+
+        # remove cache files for any datafiles which no longer exist
+        for removed in old_index.keys() - new_index.keys():
+            try:
+                self.datafile_cache_file(model, Path(removed)).unlink()
+            except FileNotFoundError:
+                pass
+        self._write_datafile_index(model, new_index, schema.signature)
+
+        return list(
+            heapq.merge(*(runs[d] for d in datafiles), key=lambda o: o[dt_attr])
+        )
+
+    def cache_model_exports(self, *, model: str, nt: Type[NamedTuple]) -> None:
+        """
+        Rebuild the cache file for a single model
+        """
+        with self.trace("sorted_exports"):
+            merged = self.sorted_model_exports(model=model, nt=nt)
+        if self.cache_format == "columnar":
+            from .cache import write_columnar_cache
+
+            write_columnar_cache(
+                self.cache_file(model),
+                merged,
+                dt_attr=self.schema(nt).dt_attr,
+                fields=nt._fields,
+            )
+        else:
+            from .cache import write_json_cache
+
+            write_json_cache(self.cache_file(model), merged)
+
+        # the hashes are shared between formats, so remove the cache file for
+        # the other format, else it might be read after it is out of date
+        for fmt in get_args(CacheFormat):
+            if fmt != self.cache_format:
+                try:
+                    self.cache_file(model, cache_format=fmt).unlink()
+                except FileNotFoundError:
+                    pass
+
+        # if the SQLite index is being used, keep it up to date as well
+        if self.sqlite_index_file().exists():
+            self.refresh_sqlite_index(model=model, nt=nt, rows=merged)
 
-        fh = hashes or self.file_hashes(for_models=for_models, models=models)
-        db_hashes: FileHashes = self._read_hash() or {}
-        for model, current_hash in fh.items():
-            if for_models and model not in for_models:
+        # a bad rollups() declaration shouldn't stop the cache from being updated
+        with self.trace("update_rollups"):
+            try:
+                self.update_rollups(model=model, nt=nt)
+            except (KeyError, TypeError, ValueError) as e:
+                import click
+
+                click.echo(f"Could not update the rollups for {model}: {e}", err=True)
+
+    def rollup_file(self, model: str) -> Path:
+        return self.cache_dir / "rollups" / f"{model}.json"
+
+    def update_rollups(
+        self, *, model: str, nt: Type[NamedTuple]
+    ) -> Dict[str, "Stats"]:
+        """
+        Update the rollups declared on a model (see ttally/aggregate.py), returning
+        the stats for each. Expects the per-datafile cache to be up to date
+
+        The stats for each datafile are saved, so only datafiles which have
+        changed since the last update are read, the rest are merged
+        """
+        from .aggregate import Aggregation, model_rollups, merge_stats
+
+        rf = self.rollup_file(model)
+        rollups = model_rollups(nt)
+        if not rollups:
+            try:
+                rf.unlink()
+            except FileNotFoundError:
+                pass
+            return {}
+
+        # if the rollups/timezone/model change, the per-file stats can't be reused
+        definitions = {r.name: [r.expr, r.by] for r in rollups}
+        tz = [time.timezone, time.altzone, *time.tzname]
+        schema = self.schema(nt)
+        try:
+            saved = self.__class__._load_json(rf.read_text())
+        except (FileNotFoundError, ValueError):
+            saved = {}
+        reusable = (
+            saved.get("definitions") == definitions
+            and saved.get("tz") == tz
+            and saved.get("schema") == schema.signature
+        )
+        old_files: Dict[str, Any] = saved["files"] if reusable else {}
+
+        aggs = {r.name: Aggregation(schema, expr=r.expr, by=r.by) for r in rollups}
+        files: Dict[str, Any] = {}
+        for name, entry in self._read_datafile_index(model, schema.signature).items():
+            old = old_files.get(name)
+            if old is not None and old["key"] == entry[:2]:
+                files[name] = old
                 continue
-            if current_hash != db_hashes.get(model):
-                cache_stale = True
-                break
+            try:
+                run = self.__class__._load_json(
+                    self.datafile_cache_file(model, Path(name)).read_text()
+                )
+            except (FileNotFoundError, ValueError):
+                run = self.sorted_datafile_exports(nt, self.data_dir / name)
+            files[name] = {
+                "key": entry[:2],
+                "stats": {
+                    rname: agg.partial(
+                        [
+                            (o[agg.dt_attr], *(o.get(f) for f in agg.fields))
+                            for o in run
+                        ]
+                    )
+                    for rname, agg in aggs.items()
+                },
+            }
 
-        return cache_stale
+        if (
+            reusable
+            and "rollups" in saved
+            and files.keys() == old_files.keys()
+            and all(files[n] is old_files[n] for n in files)
+        ):
+            rolled: Dict[str, "Stats"] = saved["rollups"]
+            return rolled
+        rolled = {
+            rname: merge_stats(f["stats"][rname] for f in files.values())
+            for rname in aggs
+        }
+        rf.parent.mkdir(parents=True, exist_ok=True)
+        tmp = rf.with_name(f".{rf.name}.{os.getpid()}.tmp")
+        tmp.write_text(
+            self.__class__._dump_json(
+                {
+                    "definitions": definitions,
+                    "tz": tz,
+                    "schema": schema.signature,
+                    "files": files,
+                    "rollups": rolled,
+                }
+            )
+        )
+        os.replace(tmp, rf)
+        return rolled
 
-    def save_hashes(
+    def read_rollup(
         self,
         *,
-        hashes: Optional[FileHashes] = None,
-        models: Optional[Dict[str, Type[NamedTuple]]] = None,
-    ) -> None:
-        new_hashes = hashes or self.file_hashes(models=models)
-        self._write_hash(new_hashes)
+        model: str,
+        name: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Tuple["Rollup", List["Bucket"]]:
+        """
+        Returns the buckets for a rollup declared on a model, updating the cache if needed
 
-    def cache_file(self, model: str) -> Path:
-        return self.cache_dir / f"{model}-cache.json"
+        If there's only one rollup, name can be omitted. since/until select the
+        buckets which include any time in that range
+        """
+        from .aggregate import Aggregation, model_rollups, to_buckets
+
+        nt = self._model_from_string(model)
+        model = self.namedtuple_func_name(nt)
+        rollups = {r.name: r for r in model_rollups(nt)}
+        if not rollups:
+            raise ValueError(f"{nt.__name__} has no rollups() declared")
+        if name is None:
+            if len(rollups) > 1:
+                raise ValueError(
+                    f"{nt.__name__} has multiple rollups, pick one of {', '.join(rollups)}"
+                )
+            name = next(iter(rollups))
+        if name not in rollups:
+            raise ValueError(
+                f"Unknown rollup '{name}', expected one of {', '.join(rollups)}"
+            )
+        rollup = rollups[name]
+
+        # this is a no-op if the cache is up to date
+        self.cache_sorted_exports(for_models={model})
+        with self.trace("read_rollups"):
+            stats = self.update_rollups(model=model, nt=nt)[name]
+        first, last = Aggregation(
+            self.schema(nt), expr=rollup.expr, by=rollup.by
+        ).bucket_range(since, until)
+        return rollup, [
+            b
+            for b in to_buckets(stats)
+            if (first is None or b.bucket >= first) and (last is None or b.bucket <= last)
+        ]
 
     def cache_sorted_exports(
         self,
         *,
         models: Optional[Dict[str, Type[NamedTuple]]] = None,
-    ) -> bool:
+        for_models: Optional[Set[str]] = None,
+    ) -> List[str]:
+        """
+        Rebuild the cache for any models which are stale, returning the names of the models which were updated
+        """
         if models is None:
             models = self.MODELS
 
-        fh = self.file_hashes(models=models)
-        cache_stale = self.cache_is_stale(hashes=fh, models=models)
-
-        if cache_stale:
-            from autotui.fileio import namedtuple_sequence_dumps
-
-            all_data = {
-                model_name: namedtuple_sequence_dumps(
-                    self.glob_namedtuple_by_datetime(model_type, reverse=False),
-                    indent=None,
-                )
-                for model_name, model_type in models.items()
-            }
-
-            for model, model_data in all_data.items():
-                with open(self.cache_file(model), "w") as f:
-                    f.write(model_data)
+        # always compare each datafile here (not just the directory mtime),
+        # so this also notices files which were edited in place
+        scanned_ns = time.time_ns()
+        dir_mtime_ns, files = self.scan_datafiles()
+        fh = self.file_hashes(models=models, for_models=for_models, files=files)
+        stale = self.stale_models(hashes=fh, for_models=for_models, models=models)
+
+        for model_name in stale:
+            self.cache_model_exports(model=model_name, nt=models[model_name])
+
+        self.save_manifest(
+            models=fh.keys(),
+            dir_mtime_ns=dir_mtime_ns,
+            scanned_ns=scanned_ns,
+            files=files,
+            signatures=self.schema_signatures(models),
+        )
+        return stale
 
-            self.save_hashes(hashes=fh, models=models)
-        return cache_stale
+    def _fresh_cache_file(
+        self,
+        *,
+        model: str,
+        models: Optional[Dict[str, Type[NamedTuple]]] = None,
+    ) -> Path:
+        with self.trace("check_cache"):
+            stale = self.cache_is_stale(for_models={model}, models=models)
+        cf = self.cache_file(model)
+        if stale or not cf.exists():
+            self.tracer.count("cache_miss")
+            raise RuntimeError(
+                "Cache is Stale" if stale else "Cache file does not exist"
+            )
+        self.tracer.count("cache_hit")
+        return cf
 
     def read_cache_str(
         self,
@@ -622,26 +1848,45 @@ class Extension:
         model: str,
         models: Optional[Dict[str, Type[NamedTuple]]] = None,
     ) -> str:
-        fh = self.file_hashes(for_models={model}, models=models)
-        if self.cache_is_stale(hashes=fh, for_models={model}):
-            raise RuntimeError("Cache is Stale")
-        cf = self.cache_file(model)
-        if not cf.exists():
-            raise RuntimeError("Cache file does not exist")
-        return cf.read_text()
+        if self.cache_format != "json":
+            raise RuntimeError(f"Cache format is {self.cache_format}, not json")
+        return self._fresh_cache_file(model=model, models=models).read_text()
 
-    @classmethod
-    def _load_json(cls, nt_string: str) -> Any:
-        try:
-            # speedup load if orjson is installed
-            import orjson  # type: ignore[import]
+    def read_cache(
+        self,
+        *,
+        model: str,
+        models: Optional[Dict[str, Type[NamedTuple]]] = None,
+    ) -> "CachedRows":
+        """
+        Read the cache for a model, in whichever format it was saved in
 
-            return orjson.loads(nt_string)
-        except ImportError:
-            pass
-        import json
+        raises a RuntimeError if the cache is stale
+        """
+        if self.cache_format == "columnar":
+            from .cache import ColumnarCache
+
+            cf = self._fresh_cache_file(model=model, models=models)
+            with self.trace("read_cache"):
+                return ColumnarCache(cf)
+        else:
+            from .cache import JSONCache
+
+            nt = (models or self.MODELS)[model]
+            data = self.read_cache_str(model=model, models=models)
+            with self.trace("read_cache"):
+                return JSONCache(
+                    self.__class__._load_json(data),
+                    dt_attr=self.schema(nt).dt_attr,
+                )
+
+    @classmethod
+    def _load_json(cls, nt_string: Union[str, bytes]) -> Any:
+        return load_json(nt_string)
 
-        return json.loads(nt_string)
+    @classmethod
+    def _dump_json(cls, obj: Any) -> str:
+        return dump_json(obj)
 
     def read_cache_json(
         self,
@@ -649,10 +1894,282 @@ class Extension:
         model: str,
         models: Optional[Dict[str, Type[NamedTuple]]] = None,
     ) -> List[Dict[str, Any]]:
-        data: List[Dict[str, Any]] = self.__class__._load_json(
-            self.read_cache_str(model=model, models=models)
+        if self.cache_format == "json":
+            data: List[Dict[str, Any]] = self.__class__._load_json(
+                self.read_cache_str(model=model, models=models)
+            )
+            return data
+        with self.read_cache(model=model, models=models) as cache:
+            return list(cache.rows())
+
+    def stream_cache(
+        self,
+        *,
+        model: str,
+        models: Optional[Dict[str, Type[NamedTuple]]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Read the cached items for a model one at a time, oldest first
+
+        If since/until are given, only items from since (inclusive) to until (exclusive) are included
+
+        raises a RuntimeError if the cache is stale (before any items are read)
+        """
+        from .cache import iter_rows
+
+        if since is not None or until is not None:
+            cache = self.read_cache(model=model, models=models)
+            start, stop = self.cached_bounds(cache, since=since, until=until)
+            return iter_rows(cache, start, stop)
+
+        cf = self._fresh_cache_file(model=model, models=models)
+        if self.cache_format == "columnar":
+            from .cache import ColumnarCache
+
+            return iter_rows(ColumnarCache(cf))
+        else:
+            from .cache import iter_json_cache
+
+            return iter_json_cache(cf)
+
+    def datafile_exports(
+        self, nt: Type[NamedTuple], datafiles: List[Path]
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yields the items from each datafile, serialized to JSON-compatible dicts
+        """
+        schema = self.schema(nt)
+        for items in self.load_datafiles(nt, datafiles):
+            yield [schema.serialize(o) for o in items]
+
+    def stream_exports(
+        self,
+        nt: Type[NamedTuple],
+        *,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Read the items from each datafile, serializing them to JSON-compatible dicts one at a time
+
+        If since/until are given, only items from since (inclusive) to until (exclusive) are included
+        """
+        model = self.namedtuple_func_name(nt)
+        datafiles = self.prune_datafiles(
+            model, sorted(self.glob_datafiles(model)), since=since, until=until
         )
-        return data
+        if since is None and until is None:
+            for items in self.datafile_exports(nt, datafiles):
+                yield from items
+            return
+
+        dt_attr = self.schema(nt).dt_attr
+        lo = since.timestamp() if since is not None else None
+        hi = until.timestamp() if until is not None else None
+        for items in self.datafile_exports(nt, datafiles):
+            for o in items:
+                if (lo is None or o[dt_attr] >= lo) and (hi is None or o[dt_attr] < hi):
+                    yield o
+
+    def cached_bounds(
+        self,
+        cache: "CachedRows",
+        *,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Tuple[int, int]:
+        """
+        The (start, stop) indexes of the cached rows from since (inclusive) to until (exclusive)
+        """
+        import math
+        from bisect import bisect_left
+
+        start, stop = 0, len(cache)
+        if since is not None:
+            start = bisect_left(cache.epochs, math.ceil(since.timestamp()))
+        if until is not None:
+            stop = bisect_left(cache.epochs, math.ceil(until.timestamp()))
+        return start, max(start, stop)
+
+    def take_cached_items(
+        self,
+        cache: "CachedRows",
+        count: Union[int, timedelta, Literal["all"]],
+        *,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Like take_items, but for cached data. Returns the newest rows
+        first, only reading the rows which are selected
+        """
+        if isinstance(count, timedelta):
+            after = datetime.now().astimezone() - count
+            since = after if since is None else max(since, after)
+        start, stop = self.cached_bounds(cache, since=since, until=until)
+        if isinstance(count, int):
+            start = max(stop - count, start)
+        items = list(cache.rows(start, stop))
+        items.reverse()
+        return items
+
+    ###########
+    #         #
+    #  QUERY  #
+    #         #
+    ###########
+
+    def sqlite_index_file(self) -> Path:
+        return self.cache_dir / "index.sqlite"
+
+    def refresh_sqlite_index(
+        self,
+        *,
+        model: str,
+        nt: Type[NamedTuple],
+        rows: Optional[List[Dict[str, Any]]] = None,
+    ) -> bool:
+        """
+        Rebuild the SQLite table for a model if its datafiles have changed
+
+        Returns True if the table was rebuilt
+        """
+        from .sqlite_index import SQLiteIndex
+
+        # if the model changes, the table has the wrong columns
+        current_hash = f"{self.schema(nt).signature}|{self.file_hash(model=model)}"
+        index = SQLiteIndex(self.sqlite_index_file())
+        try:
+            if index.saved_hash(model) == current_hash:
+                return False
+            if rows is None:
+                rows = self.sorted_model_exports(model=model, nt=nt)
+            index.rebuild(
+                model=model,
+                nt=nt,
+                dt_attr=self.schema(nt).dt_attr,
+                rows=rows,
+                hash_=current_hash,
+            )
+            return True
+        finally:
+            index.close()
+
+    def query_sqlite_index(
+        self,
+        nt: Type[NamedTuple],
+        *,
+        where: Sequence[str] = (),
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        order: Literal["asc", "desc"] = "asc",
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Filter/sort items for a model using the SQLite index, creating/updating the index if needed
+        """
+        from .sqlite_index import SQLiteIndex
+
+        model = self.namedtuple_func_name(nt)
+        self.refresh_sqlite_index(model=model, nt=nt)
+        index = SQLiteIndex(self.sqlite_index_file())
+        try:
+            yield from index.query(
+                model=model,
+                nt=nt,
+                dt_attr=self.schema(nt).dt_attr,
+                where=where,
+                since=since,
+                until=until,
+                limit=limit,
+                order=order,
+            )
+        finally:
+            index.close()
+
+    def aggregate(
+        self,
+        nt: Type[NamedTuple],
+        *,
+        expr: Optional[str] = None,
+        by: "By" = "day",
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List["Bucket"]:
+        """
+        Group the items for a model into buckets by their datetime, and compute
+        count/sum/mean/min/max of an expression (or just the count) for each
+
+        Reads from the cache if its up to date, else streams from the datafiles
+        """
+        from .aggregate import Aggregation
+
+        model = self.namedtuple_func_name(nt)
+        agg = Aggregation(self.schema(nt), expr=expr, by=by)
+        fields = [agg.dt_attr, *agg.fields]
+
+        rows: Optional[Iterable[Sequence[Any]]] = None
+        try:
+            if self.cache_format == "columnar":
+                from .cache import iter_columns
+
+                # only reads the columns which are used
+                cache = self.read_cache(model=model)
+                start, stop = self.cached_bounds(cache, since=since, until=until)
+                rows = iter_columns(cache, fields, start, stop)
+            else:
+                # read one item at a time, instead of loading the whole cache
+                lo = since.timestamp() if since is not None else None
+                hi = until.timestamp() if until is not None else None
+                rows = (
+                    tuple(o.get(f) for f in fields)
+                    for o in self.stream_cache(model=model)
+                    if (lo is None or o[agg.dt_attr] >= lo)
+                    and (hi is None or o[agg.dt_attr] < hi)
+                )
+        except RuntimeError:
+            pass
+        if rows is None:
+            rows = (
+                tuple(o.get(f) for f in fields)
+                for o in self.stream_exports(nt, since=since, until=until)
+            )
+        with self.trace("aggregate"):
+            return agg.run(rows)
+
+    ############
+    #          #
+    #  DAEMON  #
+    #          #
+    ############
+
+    def daemon_request(
+        self, request: Dict[str, Any], *, timeout: float = 60.0
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Send a request to 'ttally daemon', if its running
+
+        Returns None if the daemon isn't running, or couldn't handle the
+        request, in which case the caller should read from disk instead
+        """
+        if not self.socket_path.exists():
+            return None
+        from .server import send_requests
+
+        with self.trace("daemon_request"):
+            try:
+                resp = next(
+                    send_requests(self.socket_path, [request], timeout=timeout), None
+                )
+            except (OSError, ValueError):
+                resp = None
+        if resp is None or not resp.get("ok"):
+            self.tracer.count("daemon_miss")
+            return None
+        self.tracer.count("daemon_hit")
+        return resp
 
     #################
     #               #
@@ -662,7 +2179,22 @@ class Extension:
 
     def _autocomplete_model_names(self) -> List[str]:
         # sort this, so that the order doesn't change while tabbing through
-        return sorted(m for m in self.MODELS)
+        return sorted(self.model_names())
+
+    def _model_name_from_string(self, model_name: str) -> str:
+        """
+        Check the model exists, without importing the configuration if possible
+        """
+        model_names = self.model_names()
+        if model_name not in model_names:
+            import click
+
+            click.echo(
+                f"Could not find a model named {model_name}. Known models: {', '.join(model_names)}",
+                err=True,
+            )
+            sys.exit(1)
+        return model_name
 
     def _model_from_string(self, model_name: str) -> Type[NamedTuple]:
         try:
@@ -0,0 +1,230 @@
+"""
+A long-running process which keeps the sorted items for each model in memory,
+used by 'ttally daemon'
+
+This handles everything 'ttally serve' does, and also serves the 'recent',
+'export' and 'query' commands, which send their requests here (if the daemon
+is running) instead of reading the cache/datafiles themselves
+
+Before each request, the datafiles for the model are checked (by mtime/size),
+and only the files which have changed since the last request are parsed again.
+If the data directory hasn't changed, only the datafiles which can be written
+to in place are checked
+"""
+
+import heapq
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+    TYPE_CHECKING,
+)
+
+from .cache import JSONCache, Row
+from .server import IngestServer, Request, Response, _error
+
+if TYPE_CHECKING:
+    from .core import Extension, DatafileKey
+
+
+class WarmModel:
+    """
+    The sorted rows for one model, and the sorted rows for each of its datafiles
+    """
+
+    def __init__(self, nt: Type[NamedTuple], dt_attr: str) -> None:
+        self.nt = nt
+        self.dt_attr = dt_attr
+        self.files: Dict[Path, Tuple["DatafileKey", List[Row]]] = {}
+        self.cache = JSONCache([], dt_attr=dt_attr)
+        # the mtime of the data directory, and when the datafiles were last checked
+        self.dir_mtime_ns: Optional[int] = None
+        self.checked_ns = 0
+
+
+class Daemon(IngestServer):
+    def __init__(self, extension: "Extension", socket_path: Path) -> None:
+        super().__init__(extension, socket_path)
+        self.models: Dict[str, WarmModel] = {}
+        self.ops.update(
+            {
+                "recent": self._each(self.handle_recent),
+                "export": self._each(self.handle_export),
+                "query": self._each(self.handle_query),
+            }
+        )
+
+    @staticmethod
+    def _each(
+        func: Callable[[Request], Response]
+    ) -> Callable[[List[Request]], List[Response]]:
+        """
+        Handle each request in a batch separately
+        """
+
+        def _handle(requests: List[Request]) -> List[Response]:
+            responses: List[Response] = []
+            for req in requests:
+                try:
+                    responses.append(func(req))
+                except Exception as e:
+                    responses.append(_error(f"{type(e).__name__}: {e}"))
+            return responses
+
+        return _handle
+
+    def warm_model(self, model: str) -> WarmModel:
+        """
+        Returns the items for a model, parsing any datafiles which
+        have changed since this was last called
+        """
+        ext = self.extension
+        if model not in ext.MODELS:
+            raise ValueError(
+                f"Could not find a model named {model}. Known models: {', '.join(ext.MODELS)}"
+            )
+        if model not in self.models:
+            nt = ext.MODELS[model]
+            self.models[model] = WarmModel(nt, ext.schema(nt).dt_attr)
+        warm = self.models[model]
+
+        dir_mtime_ns = os.stat(ext.data_dir).st_mtime_ns
+        if self._unchanged(warm, dir_mtime_ns):
+            return warm
+
+        checked_ns = time.time_ns()
+        datafiles = sorted(ext.glob_datafiles(model))
+        keys = {d: ext.datafile_key(d) for d in datafiles}
+        changed = [
+            d for d in datafiles if d not in warm.files or warm.files[d][0] != keys[d]
+        ]
+        if changed or len(warm.files) != len(datafiles):
+            for datafile, items in zip(changed, ext.load_datafiles(warm.nt, changed)):
+                warm.files[datafile] = (
+                    keys[datafile],
+                    ext._sorted_exports(warm.nt, items),
+                )
+            for removed in warm.files.keys() - keys.keys():
+                del warm.files[removed]
+
+            dt_attr = warm.dt_attr
+            warm.cache = JSONCache(
+                list(
+                    heapq.merge(
+                        *(warm.files[d][1] for d in datafiles), key=lambda o: o[dt_attr]
+                    )
+                ),
+                dt_attr=dt_attr,
+            )
+        warm.dir_mtime_ns, warm.checked_ns = dir_mtime_ns, checked_ns
+        return warm
+
+    def _unchanged(self, warm: WarmModel, dir_mtime_ns: int) -> bool:
+        """
+        If the data directory mtime hasn't changed since the datafiles were last
+        checked, no files were added/removed, so only the datafiles which can be
+        written to in place need to be checked (like _unchanged_since_manifest)
+        """
+        if warm.dir_mtime_ns != dir_mtime_ns:
+            return False
+        # another change in the same timestamp tick wouldn't change the mtime
+        if warm.checked_ns - dir_mtime_ns < 2_000_000_000:
+            return False
+        ext = self.extension
+        by_name = {d.name: (d, key) for d, (key, _) in warm.files.items()}
+        # the daemon can run for a long time, so this also checks the
+        # datafiles for every month since the last check
+        for name in ext._maybe_written_in_place(by_name, warm.checked_ns):
+            datafile, key = by_name[name]
+            try:
+                if ext.datafile_key(datafile) != key:
+                    return False
+            except FileNotFoundError:
+                return False
+        return True
+
+    @staticmethod
+    def _dt(req: Request, key: str) -> Optional[datetime]:
+        if req.get(key) is None:
+            return None
+        return datetime.fromtimestamp(float(req[key]), timezone.utc)
+
+    def handle_recent(self, req: Request) -> Response:
+        """
+        {"op": "recent", "model": ..., "count": 10 | "all"} or {..., "seconds": 3600},
+        optionally with "since"/"until" epochs
+        """
+        count: Union[int, timedelta, Literal["all"]]
+        if req.get("seconds") is not None:
+            count = timedelta(seconds=float(req["seconds"]))
+        elif req.get("count", "all") == "all":
+            count = "all"
+        else:
+            count = int(req["count"])
+        warm = self.warm_model(str(req.get("model")))
+        items = self.extension.take_cached_items(
+            warm.cache,
+            count,
+            since=self._dt(req, "since"),
+            until=self._dt(req, "until"),
+        )
+        return {"ok": True, "items": items}
+
+    def handle_export(self, req: Request) -> Response:
+        """
+        {"op": "export", "model": ..., "since": epoch, "until": epoch}
+        """
+        warm = self.warm_model(str(req.get("model")))
+        start, stop = self.extension.cached_bounds(
+            warm.cache, since=self._dt(req, "since"), until=self._dt(req, "until")
+        )
+        if start == 0 and stop == len(warm.cache):
+            return {"ok": True, "items": warm.cache.data}
+        return {"ok": True, "items": warm.cache.data[start:stop]}
+
+    def handle_query(self, req: Request) -> Response:
+        """
+        {"op": "query", "model": ..., "where": [...], "since": epoch, "until": epoch, "limit": ..., "order": ...}
+        """
+
+        model = str(req.get("model"))
+        warm = self.warm_model(model)
+        # pass the rows which are already in memory, so the index
+        # doesn't have to read them from the datafiles
+        self.extension.refresh_sqlite_index(
+            model=model, nt=warm.nt, rows=warm.cache.data
+        )
+        items = list(
+            self.extension.query_sqlite_index(
+                warm.nt,
+                where=[str(w) for w in req.get("where") or []],
+                since=self._dt(req, "since"),
+                until=self._dt(req, "until"),
+                limit=req.get("limit"),
+                order="desc" if req.get("order") == "desc" else "asc",
+            )
+        )
+        return {"ok": True, "items": items}
+
+    def serve_forever(self) -> None:
+        import click
+
+        # load every model before accepting any connections
+        start = time.perf_counter()
+        for model in self.extension.MODELS:
+            self.warm_model(model)
+        click.echo(
+            f"Loaded {sum(len(w.cache) for w in self.models.values())} items in {time.perf_counter() - start:.2f}s",
+            err=True,
+        )
+        super().serve_forever()
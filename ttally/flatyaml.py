@@ -0,0 +1,127 @@
+"""
+A fast path for loading the YAML datafiles that ttally/autotui write
+
+yaml.safe_dump writes a list of flat mappings as a block sequence:
+
+- calories: 612
+  food: ramen, egg
+  when: 1605124634
+
+which is what almost every datafile looks like. This parses that one shape
+line by line, and returns None for anything else (nested values, multi-line
+strings, comments, escapes...) so the caller can fall back to a YAML parser
+
+Plain (unquoted) scalars are resolved and constructed by PyYAML itself,
+so values have the same types they would when loaded with yaml.SafeLoader
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+# the first key of an item, or any other key of the current item
+_LINE = re.compile(r"(- |  )([A-Za-z_][A-Za-z0-9_]*): (.+)")
+
+_STR_TAG = "tag:yaml.org,2002:str"
+# the implicit types that plain scalars can be constructed as,
+# anything else (timestamps, merge keys) uses the YAML parser
+_SCALAR_TAGS = {
+    _STR_TAG,
+    "tag:yaml.org,2002:int",
+    "tag:yaml.org,2002:float",
+    "tag:yaml.org,2002:bool",
+    "tag:yaml.org,2002:null",
+}
+
+
+class _NotFlat(Exception):
+    pass
+
+
+def _plain_scalar_loader() -> Callable[[str], Any]:
+    from yaml import ScalarNode
+    from yaml.constructor import SafeConstructor
+    from yaml.resolver import Resolver
+
+    resolver = Resolver()
+    constructor = SafeConstructor()
+    # values repeat a lot (e.g. the same food), so only resolve each once
+    seen: Dict[str, Any] = {}
+
+    def _load(value: str) -> Any:
+        try:
+            return seen[value]
+        except KeyError:
+            pass
+        tag = resolver.resolve(ScalarNode, value, (True, False))  # type: ignore[no-untyped-call]
+        if tag not in _SCALAR_TAGS:
+            raise _NotFlat(value)
+        if tag == _STR_TAG:
+            loaded: Any = value
+        else:
+            loaded = constructor.yaml_constructors[tag](
+                constructor, ScalarNode(tag, value)
+            )
+        seen[value] = loaded
+        return loaded
+
+    return _load
+
+
+def _scalar(value: str, load_plain: Callable[[str], Any]) -> Any:
+    first = value[0]
+    if first == "'":
+        inner = value[1:-1]
+        # a quote inside a single-quoted scalar is escaped by doubling it
+        if len(value) < 2 or value[-1] != "'" or "'" in inner.replace("''", ""):
+            raise _NotFlat(value)
+        return inner.replace("''", "'")
+    if first == '"':
+        inner = value[1:-1]
+        if len(value) < 2 or value[-1] != '"' or '"' in inner or "\\" in inner:
+            raise _NotFlat(value)
+        return inner
+    if (
+        first in "?:,[]{}#&*!|>%@`"
+        or (first == "-" and value[1:2] in ("", " "))
+        or ": " in value
+        or " #" in value
+        or value.endswith(":")
+        or value != value.strip()
+        or not value.isprintable()
+    ):
+        raise _NotFlat(value)
+    return load_plain(value)
+
+
+def load_flat_yaml(text: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Parse a YAML list of flat mappings, returns None if the
+    text isn't in the exact format yaml.safe_dump writes
+    """
+    stripped = text.rstrip()
+    if not stripped or stripped == "[]":
+        return []
+    load_plain = _plain_scalar_loader()
+    key_ok: Dict[str, bool] = {}
+    items: List[Dict[str, Any]] = []
+    item: Dict[str, Any] = {}
+    try:
+        for line in stripped.split("\n"):
+            m = _LINE.fullmatch(line)
+            if m is None:
+                return None
+            start, key, value = m.groups()
+            if key not in key_ok:
+                # keys like 'on' or 'null' wouldn't be loaded as strings
+                key_ok[key] = isinstance(load_plain(key), str)
+            if not key_ok[key]:
+                return None
+            if start == "- ":
+                item = {}
+                items.append(item)
+            elif not items:
+                return None
+            item[key] = _scalar(value, load_plain)
+    except _NotFlat:
+        return None
+    return items
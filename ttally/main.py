@@ -6,22 +6,32 @@ from typing import (
     List,
     Sequence,
     Iterable,
+    Iterator,
+    Dict,
+    Tuple,
     Any,
     Literal,
     Union,
     Generator,
+    TYPE_CHECKING,
 )
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from contextlib import contextmanager
 
 import click
-import autotui.exceptions
 
 from .core import Extension
 
+if TYPE_CHECKING:
+    from .aggregate import Bucket
+    from .server import IngestServer
+
 
 @contextmanager
 def handle_autotui_errors() -> Generator[None, None, None]:
+    import autotui.exceptions
+
     try:
         yield
     except autotui.exceptions.AutoTUIException as e:
@@ -29,18 +39,8 @@ def handle_autotui_errors() -> Generator[None, None, None]:
         sys.exit(1)
 
 
-def _parse_recent(value: Union[str, int]) -> Union[int, timedelta, Literal["all"]]:
-    if isinstance(value, int):
-        return value
-    if value.lower() == "all":
-        return "all"
-    try:
-        return int(value)
-    except ValueError:
-        pass
-
+def _parse_timedelta(value: str) -> Optional[timedelta]:
     import re
-    from datetime import timedelta
 
     timedelta_regex = re.compile(
         r"^((?P<weeks>[\.\d]+?)w)?((?P<days>[\.\d]+?)d)?((?P<hours>[\.\d]+?)h)?((?P<minutes>[\.\d]+?)m)?((?P<seconds>[\.\d]+?)s)?$"
@@ -54,15 +54,95 @@ def _parse_recent(value: Union[str, int]) -> Union[int, timedelta, Literal["all"
             name: float(param) for name, param in parts.groupdict().items() if param
         }
         return timedelta(**time_params)
+    return None
+
+
+def _parse_recent(value: Union[str, int]) -> Union[int, timedelta, Literal["all"]]:
+    if isinstance(value, int):
+        return value
+    if value.lower() == "all":
+        return "all"
+    try:
+        return int(value)
+    except ValueError:
+        pass
+
+    td = _parse_timedelta(value)
+    if td is not None:
+        return td
 
     raise click.BadParameter(
         f"{value} is not 'all', a valid integer, or a timedelta (e.g. 2d, 5h, 20m)"
     )
 
 
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse an epoch timestamp, an ISO date/datetime, or a timedelta (e.g. 2d, 5h, 20m)
+    which is relative to now
+    """
+    if value is None:
+        return None
+    try:
+        return datetime.fromtimestamp(int(value), timezone.utc)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).astimezone()
+    except ValueError:
+        pass
+    td = _parse_timedelta(value)
+    if td is not None:
+        return datetime.now().astimezone() - td
+    raise click.BadParameter(
+        f"{value} is not an epoch timestamp, an ISO datetime or a timedelta (e.g. 2d, 5h, 20m)"
+    )
+
+
+def _canonical(obj: Any) -> Any:
+    """
+    A hashable representation of a serialized item, used to find duplicates
+    """
+    if isinstance(obj, dict):
+        return tuple((k, _canonical(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return tuple(_canonical(v) for v in obj)
+    return obj
+
+
+def _print_buckets(
+    buckets: Iterable["Bucket"],
+    *,
+    stats: Sequence[str],
+    output_format: Literal["json", "table"],
+) -> None:
+    for b in buckets:
+        values = b.stats()
+        if output_format == "json":
+            sys.stdout.write(
+                json.dumps({"bucket": b.bucket, **{k: values[k] for k in stats}})
+            )
+            sys.stdout.write("\n")
+        else:
+            print(b.bucket, *(values[k] for k in stats), sep="\t")
+    sys.stdout.flush()
+
+
 def wrap_accessor(*, extension: Extension) -> click.Group:
     @click.group()
-    def call_main() -> None:
+    @click.option(
+        "--profile",
+        default=False,
+        is_flag=True,
+        help="Print how long each step took to stderr when exiting (same as TTALLY_TRACE=1)",
+    )
+    @click.option(
+        "--profile-output",
+        type=click.Path(dir_okay=False, writable=True),
+        default=None,
+        help="Also run cProfile and save the stats to this file (implies --profile)",
+    )
+    def call_main(profile: bool, profile_output: Optional[str]) -> None:
         """
         Tally things that I do often!
 
@@ -74,7 +154,8 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
         same as above, but if the model has a datetime, set it to now,
         query the 10 most recent items for a model
         """
-        pass
+        if profile or profile_output is not None:
+            extension.tracer.enable(profile_output=profile_output)
 
     @call_main.command(short_help="generate shell aliases")
     def generate() -> None:
@@ -93,6 +174,19 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
 
     model_with_completion = click.argument("MODEL", shell_complete=_model_complete)
 
+    since_option = click.option(
+        "--since",
+        default=None,
+        callback=lambda ctx, arg, value: _parse_datetime(value),
+        help="only include items after this (epoch, ISO datetime, or e.g. 2d)",
+    )
+    until_option = click.option(
+        "--until",
+        default=None,
+        callback=lambda ctx, arg, value: _parse_datetime(value),
+        help="only include items before this (epoch, ISO datetime, or e.g. 2d)",
+    )
+
     @call_main.command(short_help="add item by piping JSON")
     @model_with_completion
     @click.option(
@@ -133,6 +227,64 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
                         partial=partial,
                     )
 
+    socket_option = click.option(
+        "-s",
+        "--socket",
+        "socket_path",
+        default=None,
+        type=click.Path(dir_okay=False),
+        help="Path to the socket to listen on [default: TTALLY_SOCKET or 'ttally.sock' in the cache dir]",
+    )
+
+    def _run_server(server: "IngestServer") -> None:
+        import signal
+
+        # exit cleanly (removing the socket) when killed
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        click.echo(f"Listening on {server.socket_path}", err=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        except RuntimeError as e:
+            click.secho(f"Error: {e}", err=True, fg="red")
+            sys.exit(1)
+
+    @call_main.command(short_help="save items sent over a unix socket")
+    @socket_option
+    def serve(socket_path: Optional[str]) -> None:
+        """
+        Listen on a unix socket and save items sent to it, so that scripts
+        can save items without starting a new process each time
+
+        Send one JSON object per line, like:
+
+        \b
+        {"model": "food", "item": {"food": "apple", "calories": 95, ...}}
+
+        Items are validated like 'from-json', and one JSON response
+        per line ({"ok": true, ...}) is written back
+        """
+        from .server import IngestServer
+
+        path = Path(socket_path).absolute() if socket_path else extension.socket_path
+        _run_server(IngestServer(extension, path))
+
+    @call_main.command(short_help="keep items in memory, and serve them over a unix socket")
+    @socket_option
+    def daemon(socket_path: Optional[str]) -> None:
+        """
+        Keep the items for every model in memory, and serve the 'recent',
+        'export' and 'query' commands from memory while this is running
+
+        When datafiles change, only the changed files are parsed again.
+        This can also save items, like 'serve'
+        """
+        from .daemon import Daemon
+
+        path = Path(socket_path).absolute() if socket_path else extension.socket_path
+        _run_server(Daemon(extension, path))
+
     @call_main.command(short_help="print the datafile location")
     @model_with_completion
     @click.argument(
@@ -146,7 +298,7 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
         """
         Print the location of the current datafile for some model
         """
-        extension._model_from_string(model)
+        extension._model_name_from_string(model)
         if path_type == "cached":
             click.echo(extension.cache_file(model))
         elif path_type == "merged":
@@ -202,6 +354,8 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
         default=False,
         help="print dates in a human readable format",
     )
+    @since_option
+    @until_option
     @click.argument(
         "COUNT",
         default=10,
@@ -214,6 +368,8 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
         count: Union[int, timedelta, Literal["all"]],
         output_format: Literal["json", "table"],
         human_readable: bool,
+        since: Optional[datetime],
+        until: Optional[datetime],
     ) -> None:
         """
         List recent items logged for this model
@@ -221,31 +377,51 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
         Can provide 'all' for COUNT to list all items
         A number for COUNT to list that many items
         Or a timedelta (e.g. 2d, 5h, 20m) to list all items in that time range
+
+        --since/--until limit the items to a range of time, e.g. to
+        list the 5 most recent items from before 2023: --until 2023-01-01 5
         """
         nt = extension._model_from_string(model)
+        schema = extension.schema(nt)
 
         # try to load cached data
         res: Optional[List[NamedTuple]] = None
-        try:
-            from autotui.serialize import deserialize_namedtuple
-
-            # reverse so it is ordered for query properly
-            res_iter = list(reversed(extension.read_cache_json(model=model)))
-            res_items = extension.take_items(res_iter, count, nt)
-            res = [
-                deserialize_namedtuple(o, to=extension.MODELS[model]) for o in res_items
-            ]
-        except RuntimeError:
-            pass
+        req: Dict[str, Any] = {
+            "op": "recent",
+            "model": model,
+            "since": since.timestamp() if since is not None else None,
+            "until": until.timestamp() if until is not None else None,
+        }
+        if isinstance(count, timedelta):
+            req["seconds"] = count.total_seconds()
+        else:
+            req["count"] = count
+        resp = extension.daemon_request(req)
+        if resp is not None:
+            with extension.trace("deserialize"):
+                res = schema.deserialize_many(resp["items"])
+        else:
+            try:
+                # newest items first, so it is ordered for query properly
+                with extension.read_cache(model=model) as cache:
+                    res_items = extension.take_cached_items(
+                        cache, count, since=since, until=until
+                    )
+                with extension.trace("deserialize"):
+                    res = schema.deserialize_many(res_items)
+            except RuntimeError:
+                pass
 
         attrs = [a.strip() for a in remove_attrs.split(",") if a.strip()]
         extension.query_print(
-            extension._model_from_string(model),
+            nt,
             count,
             output_format=output_format,
             remove_attrs=attrs,
             cached_data=res,
             human_readable=human_readable,
+            since=since,
+            until=until,
         )
 
     @call_main.command(short_help="export all data from a model")
@@ -257,39 +433,344 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
         is_flag=True,
         help="Stream objects as they're read, instead of a list",
     )
-    def export(model: str, stream: bool) -> None:
+    @since_option
+    @until_option
+    def export(
+        model: str, stream: bool, since: Optional[datetime], until: Optional[datetime]
+    ) -> None:
         """
         List all the data from a model as JSON
+
+        --since/--until only include items in that range of time. When reading
+        from the datafiles, files which can't have any items in that range are skipped
         """
 
-        # read from cache if cache isn't stale
-        itr: Optional[Iterable[Any]] = None
-        try:
-            itr = extension.read_cache_json(model=model)
-        except RuntimeError:
-            pass
+        itr: Optional[Iterator[Dict[str, Any]]] = None
+        # the daemon sends every item in one response, so when streaming,
+        # read one item at a time from the cache/datafiles instead
+        resp = (
+            None
+            if stream
+            else extension.daemon_request(
+                {
+                    "op": "export",
+                    "model": model,
+                    "since": since.timestamp() if since is not None else None,
+                    "until": until.timestamp() if until is not None else None,
+                }
+            )
+        )
+        if resp is not None:
+            itr = iter(resp["items"])
+        else:
+            # read from cache if cache isn't stale
+            try:
+                itr = extension.stream_cache(model=model, since=since, until=until)
+            except RuntimeError:
+                pass
 
         # cache was stale, read from datafiles
         if itr is None:
-            from autotui.fileio import namedtuple_sequence_dumps
-
-            itr = json.loads(
-                namedtuple_sequence_dumps(
-                    list(extension.glob_namedtuple(extension._model_from_string(model)))
-                )
+            itr = extension.stream_exports(
+                extension._model_from_string(model), since=since, until=until
             )
 
-        assert itr is not None
-
+        # write each item as its read, instead of creating the entire list
         if stream:
             for blob in itr:
                 sys.stdout.write(json.dumps(blob))
                 sys.stdout.write("\n")
         else:
-            sys.stdout.write(json.dumps(list(itr)))
-            sys.stdout.write("\n")
+            sys.stdout.write("[")
+            for i, blob in enumerate(itr):
+                if i > 0:
+                    sys.stdout.write(", ")
+                sys.stdout.write(json.dumps(blob))
+            sys.stdout.write("]\n")
+        sys.stdout.flush()
+
+    @call_main.command(name="query", short_help="query a model using the SQLite index")
+    @model_with_completion
+    @click.option(
+        "-w",
+        "--where",
+        multiple=True,
+        help="SQL expression to filter by, can be passed more than once",
+    )
+    @since_option
+    @until_option
+    @click.option(
+        "-l", "--limit", type=int, default=None, help="maximum number of items"
+    )
+    @click.option(
+        "--order",
+        type=click.Choice(["asc", "desc"]),
+        default="asc",
+        help="sort by datetime, oldest or newest first",
+    )
+    def _query(
+        model: str,
+        where: Sequence[str],
+        since: Optional[datetime],
+        until: Optional[datetime],
+        limit: Optional[int],
+        order: Literal["asc", "desc"],
+    ) -> None:
+        """
+        Query the items for a model using an SQLite index, printing matching items as JSON lines
+
+        The index is kept in the cache directory, and is updated automatically
+        whenever the datafiles change. Each field on the model is a column, e.g.:
+
+        \b
+        ttally query food --where 'calories > 500' --since 30d --order desc --limit 5
+        ttally query food --where "food LIKE '%egg%'"
+
+        Datetimes are stored as epoch seconds, enums by name, and any lists or
+        other types are stored as JSON
+        """
+        import sqlite3
+
+        resp = extension.daemon_request(
+            {
+                "op": "query",
+                "model": model,
+                "where": list(where),
+                "since": since.timestamp() if since is not None else None,
+                "until": until.timestamp() if until is not None else None,
+                "limit": limit,
+                "order": order,
+            }
+        )
+        if resp is not None:
+            for blob in resp["items"]:
+                sys.stdout.write(json.dumps(blob))
+                sys.stdout.write("\n")
+            sys.stdout.flush()
+            return
+
+        nt = extension._model_from_string(model)
+        try:
+            for blob in extension.query_sqlite_index(
+                nt, where=where, since=since, until=until, limit=limit, order=order
+            ):
+                sys.stdout.write(json.dumps(blob))
+                sys.stdout.write("\n")
+        except sqlite3.OperationalError as e:
+            # e.g. an invalid --where expression
+            click.echo(f"Error: {e}", err=True)
+            sys.exit(1)
+        except sqlite3.Error as e:
+            click.echo(
+                f"Error: {e}, the index at {extension.sqlite_index_file()} may be corrupt, remove it to rebuild it",
+                err=True,
+            )
+            sys.exit(1)
         sys.stdout.flush()
 
+    @call_main.command(name="agg", short_help="sum/count/average a field by day/week/month")
+    @model_with_completion
+    @click.option("-f", "--field", default=None, help="numeric field to aggregate")
+    @click.option(
+        "-e",
+        "--expr",
+        default=None,
+        help="arithmetic expression using the fields to aggregate, e.g. 'quantity * calories'",
+    )
+    @click.option(
+        "-b",
+        "--by",
+        type=click.Choice(["day", "week", "month", "year", "all"]),
+        default="day",
+        show_default=True,
+        help="group items by",
+    )
+    @click.option(
+        "-s",
+        "--stat",
+        "stats",
+        type=click.Choice(["count", "sum", "mean", "min", "max"]),
+        multiple=True,
+        help="stats to print, can be passed more than once [default: all]",
+    )
+    @click.option(
+        "-o",
+        "--output-format",
+        type=click.Choice(["json", "table"]),
+        default="table",
+        help="how to print output",
+    )
+    @since_option
+    @until_option
+    def agg(
+        model: str,
+        field: Optional[str],
+        expr: Optional[str],
+        by: Literal["day", "week", "month", "year", "all"],
+        stats: Sequence[str],
+        output_format: Literal["json", "table"],
+        since: Optional[datetime],
+        until: Optional[datetime],
+    ) -> None:
+        """
+        Group items by their datetime and compute stats for each group
+
+        Items are read from the cache if its up to date (else the
+        datafiles) one at a time, so this doesn't need to load everything.
+        Without --field or --expr, this just counts the items. e.g.:
+
+        \b
+        ttally agg food --expr 'quantity * calories' --since 30d --stat sum
+        ttally agg weight --field pounds --by month --stat mean
+        ttally agg food --by week
+
+        Expressions can use numbers, the fields on the model, + - * / // % **
+        and abs/round/min/max. Items which are missing a value are skipped
+        """
+        from .aggregate import STATS
+
+        if field is not None and expr is not None:
+            raise click.UsageError("Pass one of --field or --expr, not both")
+        if field is not None:
+            expr = field
+        if not stats:
+            stats = STATS if expr is not None else ("count",)
+        elif expr is None and set(stats) - {"count"}:
+            raise click.UsageError("Pass --field or --expr to compute anything other than 'count'")
+
+        try:
+            buckets = extension.aggregate(
+                extension._model_from_string(model),
+                expr=expr,
+                by=by,
+                since=since,
+                until=until,
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        with extension.trace("print"):
+            _print_buckets(buckets, stats=stats, output_format=output_format)
+
+    @call_main.command(name="rollup", short_help="print a rollup declared on a model")
+    @model_with_completion
+    @click.argument("NAME", required=False, default=None)
+    @click.option(
+        "-s",
+        "--stat",
+        "stats",
+        type=click.Choice(["count", "sum", "mean", "min", "max"]),
+        multiple=True,
+        help="stats to print, can be passed more than once [default: all]",
+    )
+    @click.option(
+        "-o",
+        "--output-format",
+        type=click.Choice(["json", "table"]),
+        default="table",
+        help="how to print output",
+    )
+    @since_option
+    @until_option
+    def rollup(
+        model: str,
+        name: Optional[str],
+        stats: Sequence[str],
+        output_format: Literal["json", "table"],
+        since: Optional[datetime],
+        until: Optional[datetime],
+    ) -> None:
+        """
+        Print a rollup (a precomputed 'ttally agg') declared on a model with
+        a 'rollups' staticmethod. NAME can be omitted if there's only one
+
+        Rollups are kept up to date by 'ttally update-cache', only re-reading
+        datafiles which have changed. If the cache is stale, it is updated first
+
+        --since/--until select the buckets which include any time in that range
+        """
+        from .aggregate import STATS
+
+        try:
+            declared, buckets = extension.read_rollup(
+                model=model, name=name, since=since, until=until
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        if not stats:
+            stats = STATS if declared.expr is not None else ("count",)
+        elif declared.expr is None and set(stats) - {"count"}:
+            raise click.UsageError(f"Rollup '{declared.name}' only counts items")
+
+        with extension.trace("print"):
+            _print_buckets(buckets, stats=stats, output_format=output_format)
+
+    @call_main.command(name="when", short_help="query items using python lambdas")
+    @click.option(
+        "-e",
+        "--eval",
+        "eval_str",
+        multiple=True,
+        type=str,
+        default=(),
+        help="Evaluate some python code before running the queries",
+    )
+    @click.argument("QUERY", type=str, nargs=-1)
+    def _when(eval_str: Sequence[str], query: Sequence[str]) -> None:
+        """
+        Each query is a python lambda filter, which is applied to
+        the items from a model. The name of the variable in the
+        lambda determines the model
+
+        All the queries for a model share a single pass over its items,
+        newest first, so the data is only read once
+
+        \b
+        There are a few helper functions to make it easier to write:
+            when - returns the datetime for the item
+            since - returns a timedelta between the date of the item and now
+            recent - given a list of items, returns the most recent
+            desc - returns a human readable description of the item
+            descs - for 'results', returns a list of human readable descriptions of the items
+            dt_humanize and format_dt - for formatting datetimes
+
+        \b
+        for example, for the food model, to print any vitamins I ate in the last day
+            'lambda food: "vitamin" in food.food and since(food) < timedelta(days=1)'
+
+        \b
+        to check if Ive logged my weight in the last week
+            'lambda weight: since(weight) < timedelta(weeks=1)'
+
+        \b
+        To perform a different action on each result, add a '>>' after the lambda, with some other
+        code to run. For example, to print everything that is over 1000 calories:
+            'lambda food: food.quantity * food.calories > 1000 >> print(food.food, food.when)'
+
+        \b
+        If you instead want to run a function on the list of results, you can use a '>>>'
+        and use the variable 'results' to refer to the list of results. For example, to
+        figure out when the last time I did something was, and when I should do it next:
+            'lambda food: "vitamin" in food.food >>> print(desc(recent(results), name="vitamin", with_timedelta=timedelta(hours=24), line_format="json"))'
+
+        If 'results' is only used as 'recent(results)', the scan stops at
+        the most recent match, instead of reading every item
+        """
+        from .when import Query, query_namespace, run_queries
+
+        namespace = query_namespace()
+        for s in eval_str:
+            exec(s, namespace)
+
+        parsed = [
+            Query.from_str(q, models=extension.MODELS, namespace=namespace)
+            for q in query
+        ]
+        if not parsed:
+            click.echo("No queries provided", err=True)
+            return
+        run_queries(extension, parsed)
+
     @call_main.command(short_help="merge all data for a model into one file")
     @model_with_completion
     @click.option(
@@ -306,21 +787,31 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
         """
         Merge all datafiles for one model into a single '-merged.json' file
         """
+        import time
+        import heapq
         from pathlib import Path
-        from datetime import datetime
 
-        from autotui.fileio import namedtuple_sequence_dumps
         from more_itertools import unique_everseen
 
-        datafiles: List[Path] = list(extension.glob_datafiles(model))
+        datafiles: List[Path] = sorted(extension.glob_datafiles(model))
         if len(datafiles) == 0:
             click.echo(f"No datafiles for model {model}", err=True)
             return
 
-        data = json.loads(
-            namedtuple_sequence_dumps(
-                list(extension.glob_namedtuple(extension._model_from_string(model)))
+        started = time.perf_counter()
+
+        # each item is serialized once, and the (item, encoded) pairs are
+        # used for the backup, sorting/removing duplicates and the merged file
+        runs: List[List[Tuple[Dict[str, Any], str]]] = [
+            [(obj, extension._dump_json(obj)) for obj in items]
+            for items in extension.datafile_exports(
+                extension._model_from_string(model), datafiles
             )
+        ]
+        total = sum(len(run) for run in runs)
+        click.echo(
+            f"Loaded {total} items from {len(datafiles)} datafiles in {time.perf_counter() - started:.2f}s",
+            err=True,
         )
 
         # write backup before sorting/removing datafiles
@@ -329,20 +820,44 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
 
         click.echo(f"Writing backup to '{cachefile}'", err=True)
         with cachefile.open("w") as backup_f:
-            json.dump(data, backup_f)
+            backup_f.write(f"[{','.join(enc for run in runs for _, enc in run)}]")
+
+        merged: Iterable[Tuple[Dict[str, Any], str]]
 
         # if provided, use sort key
-        if sort_key is not None and len(data) > 0:
-            assert sort_key in data[0], f"Could not find {sort_key} in {data[0]}"
-            data = list(sorted(data, key=lambda obj: obj[sort_key]))  # type: ignore[no-any-return]
+        if sort_key is not None and total > 0:
+            first = next(run[0][0] for run in runs if run)
+            assert sort_key in first, f"Could not find {sort_key} in {first}"
+            sort_started = time.perf_counter()
+
+            def _sort_key(pair: Tuple[Dict[str, Any], str]) -> Any:
+                return pair[0][sort_key]
+
+            # each datafile is mostly in order already, so sort each
+            # and then merge the sorted runs
+            sorted_runs = [sorted(run, key=_sort_key) for run in runs]
+            merged = list(heapq.merge(*sorted_runs, key=_sort_key))
+            click.echo(
+                f"Sorted {total} items by '{sort_key}' in {time.perf_counter() - sort_started:.2f}s",
+                err=True,
+            )
+        else:
+            merged = [pair for run in runs for pair in run]
 
         if remove_duplicates:
-            new_data = list(unique_everseen(data, key=lambda obj: json.dumps(obj)))
-            if len(new_data) != len(data):
-                click.echo(f"Removed {len(data) - len(new_data)} duplicates", err=True)
+            dedupe_started = time.perf_counter()
+            new_merged = list(
+                unique_everseen(merged, key=lambda pair: _canonical(pair[0]))
+            )
+            removed = total - len(new_merged)
+            if removed > 0:
+                click.echo(
+                    f"Removed {removed} duplicates in {time.perf_counter() - dedupe_started:.2f}s",
+                    err=True,
+                )
             else:
                 click.echo("No duplicates found", err=True)
-            data = new_data
+            merged = new_merged
 
         # remove current datafiles
         for rmf in datafiles:
@@ -350,10 +865,20 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
             rmf.unlink()
 
         merge_target = extension.ttally_merged_path(model)
+        count = 0
         with merge_target.open("w") as merged_f:
-            json.dump(data, merged_f)
+            merged_f.write("[")
+            for _, enc in merged:
+                if count > 0:
+                    merged_f.write(",")
+                merged_f.write(enc)
+                count += 1
+            merged_f.write("]")
 
-        click.echo(f"Wrote merged file to '{merge_target}'", err=True)
+        click.echo(
+            f"Wrote {count} items to merged file '{merge_target}' in {time.perf_counter() - started:.2f}s",
+            err=True,
+        )
 
     @call_main.command(short_help="cache export data", name="update-cache")
     @click.option(
@@ -362,22 +887,72 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
         default=False,
         help="print current filehash debug info",
     )
-    def update_cache(print_hashes: bool) -> None:
+    @click.option(
+        "-w",
+        "--watch",
+        is_flag=True,
+        default=False,
+        help="keep running, updating the cache whenever the datafiles change",
+    )
+    @click.option(
+        "--debounce",
+        type=float,
+        default=0.5,
+        show_default=True,
+        help="with --watch, seconds to wait for changes to settle before updating",
+    )
+    @click.argument("MODELS", nargs=-1, shell_complete=_model_complete)
+    def update_cache(
+        print_hashes: bool, watch: bool, debounce: float, models: Sequence[str]
+    ) -> None:
         """
         Caches data for 'export' and 'recent' by saving
         the current data and an index to ~/.cache/ttally
 
+        If no MODELS are given, updates the cache for all models
+
         exit code 0 if cache was updated, 2 if it was already up to date
+
+        With --watch, this keeps running and watches the data directory
+        (using inotify if available, else polling), updating the cache
+        for any models whose datafiles change
         """
-        was_stale = extension.cache_sorted_exports()
+        for m in models:
+            extension._model_from_string(m)
+        for_models = set(models) if models else None
+        updated = extension.cache_sorted_exports(for_models=for_models)
+        if watch:
+            from .watch import watch_changes
+
+            if updated:
+                click.echo(f"Cache was stale, updated {', '.join(updated)}", err=True)
+            try:
+                for changed in watch_changes(extension.data_dir, debounce=debounce):
+                    affected = extension.models_for_datafiles(changed)
+                    if for_models is not None:
+                        affected &= for_models
+                    if not affected:
+                        continue
+                    try:
+                        updated = extension.cache_sorted_exports(for_models=affected)
+                    except Exception as e:
+                        # e.g. a datafile which is only partially synced, it
+                        # will be updated again when the sync finishes
+                        click.echo(f"Error updating {', '.join(affected)}: {e}", err=True)
+                        continue
+                    if updated:
+                        click.echo(f"Updated {', '.join(updated)}", err=True)
+            except KeyboardInterrupt:
+                pass
+            return
         ret = 0
-        if was_stale:
-            click.echo("Cache was stale, updated", err=True)
+        if updated:
+            click.echo(f"Cache was stale, updated {', '.join(updated)}", err=True)
         else:
             click.echo("Cache is already up to date", err=True)
             ret = 2
         if print_hashes:
-            click.echo(json.dumps(extension.file_hashes()))
+            click.echo(json.dumps(extension.file_hashes(for_models=for_models)))
         sys.exit(ret)
 
     @call_main.command(short_help="edit the datafile")
@@ -414,16 +989,13 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
             click.secho(f"Error: {f} doesn't exist. ", err=True, fg="red")
             return
 
-        from autotui.shortcuts import load_from
-
-        data = list(load_from(to=nt, path=f))
+        data = extension.load_datafile(nt, f)
         if len(data) == 0:
             click.secho(f"Error: No data for {model}", err=True, fg="red")
             return
 
         from autotui.pick import pick_namedtuple
         from autotui.edit import edit_namedtuple
-        from autotui.shortcuts import dump_to
 
         def _nt_string(d: NamedTuple) -> str:
             return ", ".join([f"{k}: {v}" for k, v in d._asdict().items()])
@@ -448,7 +1020,7 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
             err=True,
         )
 
-        dump_to(data, f)
+        extension.dump_datafile(data, f)
 
     @call_main.command(short_help="drop the last n items")
     @click.option(
@@ -471,9 +1043,8 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
             return
 
         import pprint
-        from autotui.shortcuts import load_from, dump_to
 
-        data = list(load_from(to=nt, path=f))
+        data = extension.load_datafile(nt, f)
         if len(data) == 0:
             click.secho(f"Error: No data for {model}", err=True, fg="red")
             return
@@ -489,6 +1060,113 @@ def wrap_accessor(*, extension: Extension) -> click.Group:
             if click.confirm("Remove file?"):
                 f.unlink()
         else:
-            dump_to(data, f)
+            extension.dump_datafile(data, f)
+
+    def _parse_list(value: str) -> List[str]:
+        return [v.strip() for v in value.split(",") if v.strip()]
+
+    @call_main.command(short_help="benchmark common operations on generated data")
+    @click.option(
+        "-n",
+        "--records",
+        default="1000,10000",
+        show_default=True,
+        help="comma separated, number of items to generate for each model",
+    )
+    @click.option(
+        "--devices",
+        default="1,3",
+        show_default=True,
+        help="comma separated, number of devices to spread the items across",
+    )
+    @click.option(
+        "--months",
+        default="12",
+        show_default=True,
+        help="comma separated, number of months to spread the items across",
+    )
+    @click.option(
+        "--format",
+        "formats",
+        default="yaml,json,merged",
+        show_default=True,
+        help="comma separated, how to save the datafiles ('merged' is one JSON file for each model)",
+    )
+    @click.option(
+        "--op",
+        "ops",
+        multiple=True,
+        help="only run this operation, can be passed more than once [default: all]",
+    )
+    @click.option(
+        "--repeat", default=3, show_default=True, help="number of times to run each operation"
+    )
+    @click.option(
+        "--config",
+        default=None,
+        type=click.Path(exists=True, dir_okay=False),
+        help="python file with the NamedTuple models to generate items for [default: Food/Weight models]",
+    )
+    @click.option("--seed", default=0, show_default=True, help="random seed for the generated items")
+    @click.option(
+        "-o",
+        "--output",
+        default=None,
+        type=click.Path(dir_okay=False),
+        help="write the results to this file instead of STDOUT",
+    )
+    def bench(
+        records: str,
+        devices: str,
+        months: str,
+        formats: str,
+        ops: Sequence[str],
+        repeat: int,
+        config: Optional[str],
+        seed: int,
+        output: Optional[str],
+    ) -> None:
+        """
+        Time loading, caching, 'recent', 'export', 'from-json' and 'merge'
+        on generated datafiles, and print the results as JSON
+
+        Each combination of --records/--devices/--months/--format is run in a
+        temporary directory, so this never reads or writes your data. The
+        operations are glob_namedtuple, cache_sorted_exports, recent,
+        recent_timedelta, export_stream, recent_cold, export_stream_cold,
+        from_json and merge
+        """
+        from . import bench as ttally_bench
+
+        try:
+            scenarios = list(
+                ttally_bench.scenario_matrix(
+                    records=[int(r) for r in _parse_list(records)],
+                    devices=[int(d) for d in _parse_list(devices)],
+                    months=[int(m) for m in _parse_list(months)],
+                    formats=_parse_list(formats),
+                )
+            )
+            results = ttally_bench.run_benchmarks(
+                scenarios,
+                config=(
+                    Path(config).read_text()
+                    if config is not None
+                    else ttally_bench.DEFAULT_CONFIG
+                ),
+                repeat=repeat,
+                ops=ops or ttally_bench.OPERATIONS,
+                seed=seed,
+                progress=lambda msg: click.echo(msg, err=True),
+            )
+        except ValueError as e:
+            raise click.UsageError(str(e))
+
+        dumped = json.dumps(results, indent=2)
+        if output is not None:
+            Path(output).write_text(dumped + "\n")
+            click.echo(f"Wrote results to '{output}'", err=True)
+        else:
+            click.echo(dumped)
 
     return call_main
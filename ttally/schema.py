@@ -0,0 +1,211 @@
+"""
+Per-model information computed from the NamedTuple annotations
+
+autotui inspects the signature of the NamedTuple every time an item is
+(de)serialized, and ttally used to do the same to find the datetime attribute.
+This does that once for each model, and compiles converters for the field
+types which are (almost) always used in models, so the hot paths (sorting,
+filtering, printing, reading the cache) don't do any reflection
+
+Anything the converters don't handle (enums, containers, nested NamedTuples,
+missing values for non-optional fields) falls back to autotui, so items are
+converted exactly the same way as before
+"""
+
+from datetime import datetime, timezone
+from functools import lru_cache
+from operator import attrgetter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+
+def _load_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        lval = value.lower()
+        if lval == "true":
+            return True
+        elif lval == "false":
+            return False
+    return bool(value)
+
+
+def _load_datetime(value: Any) -> datetime:
+    return datetime.fromtimestamp(int(value), timezone.utc)
+
+
+def _dump_datetime(value: datetime) -> int:
+    return int(value.timestamp())
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+# field type -> (deserializer, serializer)
+_CONVERTERS: Dict[type, Tuple[Callable[[Any], Any], Callable[[Any], Any]]] = {
+    datetime: (_load_datetime, _dump_datetime),
+    str: (str, _identity),
+    int: (int, _identity),
+    float: (float, _identity),
+    bool: (_load_bool, _identity),
+}
+
+# (field name, converter, is optional)
+_Converter = Tuple[str, Callable[[Any], Any], bool]
+
+
+class ModelSchema:
+    """
+    The fields, resolved types and datetime attribute for a model
+    """
+
+    def __init__(self, nt: Type[NamedTuple]) -> None:
+        import inspect
+        from autotui.typehelpers import resolve_annotation_single
+
+        self.nt = nt
+        # field name -> (resolved type, is optional)
+        self.types: Dict[str, Tuple[Any, bool]] = {
+            attr_name: resolve_annotation_single(param.annotation)
+            for attr_name, param in inspect.signature(nt).parameters.items()
+        }
+        self.fields: Tuple[str, ...] = tuple(self.types)
+        self._dt_attr = self.find_attr(datetime)
+
+        self._loaders: Optional[List[_Converter]] = None
+        self._dumpers: Optional[List[_Converter]] = None
+        if all(attr_type in _CONVERTERS for attr_type, _ in self.types.values()):
+            self._loaders = [
+                (name, _CONVERTERS[attr_type][0], optional)
+                for name, (attr_type, optional) in self.types.items()
+            ]
+            self._dumpers = [
+                (name, _CONVERTERS[attr_type][1], optional)
+                for name, (attr_type, optional) in self.types.items()
+            ]
+
+    def __repr__(self) -> str:
+        return f"ModelSchema({self.nt.__name__}, fields={self.fields})"
+
+    @property
+    def signature(self) -> str:
+        """
+        The fields and resolved types, saved with any cached (serialized) items,
+        so they aren't used after the model changes
+        """
+        return ",".join(
+            f"{name}:{attr_type!r}{'?' if optional else ''}"
+            for name, (attr_type, optional) in self.types.items()
+        )
+
+    def find_attr(self, _type: Any) -> Optional[str]:
+        """
+        The first field with this type, if there is one
+        """
+        for attr_name, (attr_type, _) in self.types.items():
+            if attr_type == _type:
+                return attr_name
+        return None
+
+    @property
+    def dt_attr(self) -> str:
+        if self._dt_attr is None:
+            raise TypeError(f"Could not find {datetime} on {self.nt}")
+        return self._dt_attr
+
+    @property
+    def key(self) -> Callable[[Any], datetime]:
+        """
+        Returns the datetime from an item
+        """
+        return attrgetter(self.dt_attr)
+
+    def epoch(self, obj: Dict[str, Any]) -> int:
+        """
+        Returns the datetime from a serialized item, as epoch seconds
+        """
+        return int(obj[self.dt_attr])
+
+    def missing(self, obj: Dict[str, Any]) -> List[str]:
+        """
+        Any fields which aren't Optional, but are missing/None in a serialized item
+        """
+        return [
+            name
+            for name, (_, optional) in self.types.items()
+            if not optional and obj.get(name) is None
+        ]
+
+    def deserialize(self, obj: Dict[str, Any]) -> Any:
+        """
+        Convert a dict (loaded from a datafile/the cache) to a NamedTuple
+        """
+        if self._loaders is not None:
+            values: List[Any] = []
+            for name, load, optional in self._loaders:
+                value = obj.get(name)
+                if value is None:
+                    if not optional:
+                        break
+                    values.append(None)
+                else:
+                    values.append(load(value))
+            else:
+                return self.nt(*values)
+
+        from autotui.serialize import deserialize_namedtuple
+
+        return deserialize_namedtuple(obj, to=self.nt)
+
+    def deserialize_many(self, objs: Sequence[Dict[str, Any]]) -> List[Any]:
+        """
+        Convert a batch of dicts to NamedTuples, converting one field
+        (column) at a time instead of one item at a time
+        """
+        if not self._loaders:
+            return [self.deserialize(o) for o in objs]
+        columns: List[List[Any]] = []
+        for name, load, optional in self._loaders:
+            values = [o.get(name) for o in objs]
+            if optional:
+                columns.append([None if v is None else load(v) for v in values])
+            elif None in values:
+                # autotui warns about these, so convert them one at a time
+                return [self.deserialize(o) for o in objs]
+            else:
+                columns.append(list(map(load, values)))
+        return list(map(self.nt._make, zip(*columns)))
+
+    def serialize(self, item: Any) -> Dict[str, Any]:
+        """
+        Convert a NamedTuple to a JSON-compatible dict
+        """
+        if self._dumpers is not None:
+            data: Dict[str, Any] = {}
+            for (name, dump, optional), value in zip(self._dumpers, item):
+                if value is None:
+                    if not optional:
+                        break
+                    data[name] = None
+                else:
+                    data[name] = dump(value)
+            else:
+                return data
+
+        from autotui.serialize import serialize_namedtuple
+
+        return serialize_namedtuple(item)
+
+
+@lru_cache(maxsize=None)
+def model_schema(nt: Type[NamedTuple]) -> ModelSchema:
+    return ModelSchema(nt)
@@ -0,0 +1,188 @@
+"""
+A long-running process which listens on a Unix socket, used by 'ttally serve'
+
+This lets scripts save items without starting python and importing the
+configuration every time. Clients connect, write one JSON request per line,
+close their end of the connection and then read one JSON response per line
+(in the same order as the requests)
+
+A request looks like:
+
+{"op": "add", "model": "food", "item": {"food": "apple", "calories": 95, ...}}
+
+'op' defaults to 'add', and 'items' can be used instead of 'item' to send a list.
+Items are validated the same way 'ttally from-json' validates them, and then
+all the items for a model from one connection are written to the datafile at once
+"""
+
+import os
+import socket
+import socketserver
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TYPE_CHECKING,
+)
+
+from .core import load_json, dump_json
+
+if TYPE_CHECKING:
+    from .core import Extension
+
+Request = Dict[str, Any]
+Response = Dict[str, Any]
+
+
+def _error(msg: str) -> Response:
+    return {"ok": False, "error": msg}
+
+
+class IngestServer:
+    def __init__(self, extension: "Extension", socket_path: Path) -> None:
+        self.extension = extension
+        self.socket_path = socket_path
+        # maps 'op' to a function which handles a batch of those requests,
+        # returning a response for each one
+        self.ops: Dict[str, Callable[[List[Request]], List[Response]]] = {
+            "add": self.handle_add,
+        }
+
+    def handle_add(self, requests: List[Request]) -> List[Response]:
+        responses: List[Response] = []
+        # group the validated items by model, so each datafile is written once
+        pending: Dict[str, List[NamedTuple]] = {}
+        for req in requests:
+            try:
+                model = str(req.get("model"))
+                if model not in self.extension.MODELS:
+                    raise ValueError(
+                        f"Could not find a model named {model}. Known models: {', '.join(self.extension.MODELS)}"
+                    )
+                schema = self.extension.schema(self.extension.MODELS[model])
+                blobs = req["items"] if "items" in req else [req.get("item")]
+                if not isinstance(blobs, list) or not all(
+                    isinstance(b, dict) for b in blobs
+                ):
+                    raise TypeError("Expected 'item' to be an object")
+                # autotui would only warn and save these as null
+                for blob in blobs:
+                    missing = schema.missing(blob)
+                    if missing:
+                        raise ValueError(
+                            f"Missing required fields: {', '.join(missing)}"
+                        )
+                items = schema.deserialize_many(blobs)
+            except Exception as e:
+                responses.append(_error(f"{type(e).__name__}: {e}"))
+                continue
+            pending.setdefault(model, []).extend(items)
+            responses.append({"ok": True, "model": model, "count": len(items)})
+
+        for model, items in pending.items():
+            try:
+                self.extension.add_to_datafile(items, self.extension.datafile(model))
+            except Exception as e:
+                for resp in responses:
+                    if resp.get("model") == model:
+                        resp.clear()
+                        resp.update(_error(f"{type(e).__name__}: {e}"))
+        return responses
+
+    def handle(self, lines: Sequence[bytes]) -> List[Response]:
+        """
+        Handle the requests from one connection
+
+        Requests for the same 'op' are handled together, but the
+        responses are returned in the same order as the requests
+        """
+        responses: List[Optional[Response]] = [None] * len(lines)
+        batches: Dict[str, List[int]] = {}
+        requests: List[Request] = []
+        for i, line in enumerate(lines):
+            try:
+                req = load_json(line)
+                if not isinstance(req, dict):
+                    raise TypeError(f"Expected a JSON object, got {type(req).__name__}")
+            except Exception as e:
+                responses[i] = _error(f"Could not parse request: {e}")
+                req = {}
+            requests.append(req)
+            if responses[i] is not None:
+                continue
+            op = str(req.get("op", "add"))
+            if op not in self.ops:
+                responses[i] = _error(f"Unknown op '{op}', expected one of {list(self.ops)}")
+                continue
+            batches.setdefault(op, []).append(i)
+
+        for op, indexes in batches.items():
+            for i, resp in zip(indexes, self.ops[op]([requests[i] for i in indexes])):
+                responses[i] = resp
+        return [r if r is not None else _error("No response") for r in responses]
+
+    def _make_handler(self) -> Any:
+        server = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                lines = [ln for ln in self.rfile if ln.strip()]
+                for resp in server.handle(lines):
+                    self.wfile.write(f"{dump_json(resp)}\n".encode("utf-8"))
+
+        return _Handler
+
+    def serve_forever(self) -> None:
+        if self.socket_path.exists():
+            if is_listening(self.socket_path):
+                raise RuntimeError(f"Already listening on {self.socket_path}")
+            # left behind by a process which didn't exit cleanly
+            self.socket_path.unlink()
+
+        # import the configuration before accepting any connections
+        self.extension.MODELS
+
+        # this handles one connection at a time, so writes
+        # to the datafiles never happen concurrently
+        with socketserver.UnixStreamServer(
+            str(self.socket_path), self._make_handler()
+        ) as srv:
+            os.chmod(self.socket_path, 0o600)
+            try:
+                srv.serve_forever()
+            finally:
+                self.socket_path.unlink(missing_ok=True)
+
+
+def is_listening(socket_path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def send_requests(
+    socket_path: Path, requests: Sequence[Request], *, timeout: Optional[float] = None
+) -> Iterator[Response]:
+    """
+    Send requests to a running server, yielding the responses
+
+    Raises OSError if there is nothing listening on the socket
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(socket_path))
+        sock.sendall("".join(f"{dump_json(r)}\n" for r in requests).encode("utf-8"))
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile("rb") as f:
+            for line in f:
+                if line.strip():
+                    yield load_json(line)
@@ -0,0 +1,164 @@
+"""
+An optional SQLite index for the models, used by 'ttally query'
+
+Each model has its own table, with a column for each field on the NamedTuple
+and an index on the datetime attribute. Values are stored the same way they
+are in the datafiles/cache (datetimes as epoch seconds, enums by name), any
+containers or other types which don't map onto a SQLite type are stored as JSON
+"""
+
+import json
+import math
+import sqlite3
+from pathlib import Path
+from datetime import datetime
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+Order = Literal["asc", "desc"]
+
+# (column name, SQLite type, how to convert the stored value back)
+Column = Tuple[str, str, Literal["value", "bool", "json"]]
+
+
+def _quote(name: str) -> str:
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def model_columns(nt: Type[NamedTuple]) -> List[Column]:
+    """
+    Compute the SQLite columns from the NamedTuple annotations
+    """
+    import inspect
+    from enum import Enum
+    from autotui.typehelpers import is_supported_container
+    from .schema import model_schema
+
+    columns: List[Column] = []
+    for attr_name, (attr_type, _) in model_schema(nt).types.items():
+        if is_supported_container(attr_type):
+            columns.append((attr_name, "TEXT", "json"))
+        elif attr_type is bool:
+            columns.append((attr_name, "INTEGER", "bool"))
+        elif attr_type is int or attr_type is datetime:
+            columns.append((attr_name, "INTEGER", "value"))
+        elif attr_type is float:
+            columns.append((attr_name, "REAL", "value"))
+        elif attr_type is str or (
+            inspect.isclass(attr_type) and issubclass(attr_type, Enum)
+        ):
+            columns.append((attr_name, "TEXT", "value"))
+        else:
+            columns.append((attr_name, "TEXT", "json"))
+    return columns
+
+
+class SQLiteIndex:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS _ttally_models (model TEXT PRIMARY KEY, hash TEXT NOT NULL)"
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def saved_hash(self, model: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT hash FROM _ttally_models WHERE model = ?", (model,)
+        ).fetchone()
+        return None if row is None else str(row[0])
+
+    def rebuild(
+        self,
+        *,
+        model: str,
+        nt: Type[NamedTuple],
+        dt_attr: str,
+        rows: Sequence[Dict[str, Any]],
+        hash_: str,
+    ) -> None:
+        """
+        Replace the table for this model with the (serialized) rows
+        """
+        columns = model_columns(nt)
+        table = _quote(model)
+        with self.conn:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute(
+                f"CREATE TABLE {table} ({', '.join(f'{_quote(n)} {t}' for n, t, _ in columns)})"
+            )
+            self.conn.executemany(
+                f"INSERT INTO {table} VALUES ({', '.join('?' for _ in columns)})",
+                (
+                    tuple(
+                        json.dumps(o[n])
+                        if kind == "json" and o.get(n) is not None
+                        else o.get(n)
+                        for n, _, kind in columns
+                    )
+                    for o in rows
+                ),
+            )
+            self.conn.execute(
+                f"CREATE INDEX {_quote(f'{model}_{dt_attr}')} ON {table} ({_quote(dt_attr)})"
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO _ttally_models (model, hash) VALUES (?, ?)",
+                (model, hash_),
+            )
+
+    def query(
+        self,
+        *,
+        model: str,
+        nt: Type[NamedTuple],
+        dt_attr: str,
+        where: Sequence[str] = (),
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        order: Order = "asc",
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the matching rows, in the same format as 'ttally export'
+
+        'where' is a list of SQL expressions, which are combined with AND
+        """
+        columns = model_columns(nt)
+        clauses = [f"({w})" for w in where]
+        params: List[Any] = []
+        if since is not None:
+            clauses.append(f"{_quote(dt_attr)} >= ?")
+            params.append(math.ceil(since.timestamp()))
+        if until is not None:
+            clauses.append(f"{_quote(dt_attr)} < ?")
+            params.append(math.ceil(until.timestamp()))
+        sql = f"SELECT {', '.join(_quote(n) for n, _, _ in columns)} FROM {_quote(model)}"
+        if clauses:
+            sql += f" WHERE {' AND '.join(clauses)}"
+        sql += f" ORDER BY {_quote(dt_attr)} {'DESC' if order == 'desc' else 'ASC'}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        for row in self.conn.execute(sql, params):
+            blob: Dict[str, Any] = {}
+            for (name, _, kind), value in zip(columns, row):
+                if value is not None and kind == "json":
+                    value = json.loads(value)
+                elif value is not None and kind == "bool":
+                    value = bool(value)
+                blob[name] = value
+            yield blob
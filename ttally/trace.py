@@ -0,0 +1,128 @@
+"""
+Timing instrumentation, enabled with 'ttally --profile' or the TTALLY_TRACE
+environment variable
+
+The Extension records how long each phase (importing the configuration,
+finding/parsing datafiles, checking the cache, sorting, printing...) takes,
+and counts things like the number of datafiles/items parsed and cache hits.
+When enabled, a summary is printed to stderr when the process exits
+
+Subclasses can add their own phases/counters:
+
+with self.trace("my_phase"):
+    ...
+self.tracer.count("my_counter")
+"""
+
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Iterator, List, Optional, TextIO, Tuple
+
+_NULL: ContextManager[None] = nullcontext()
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = False
+        self.started = time.perf_counter()
+        # the names of the phase and its parents -> [total seconds, calls]
+        self.phases: Dict[Tuple[str, ...], List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.profile_output: Optional[str] = None
+        self._path: Tuple[str, ...] = ()
+        self._profiler: Optional[object] = None
+        self._reported = False
+        if enabled:
+            self.enable()
+
+    def enable(self, *, profile_output: Optional[str] = None) -> None:
+        """
+        Start recording, and print the summary when the process exits
+
+        If profile_output is given, this also runs cProfile,
+        and saves the stats (see the pstats module) to that file
+        """
+        import atexit
+
+        if not self.enabled:
+            self.enabled = True
+            atexit.register(self.report)
+        if profile_output is not None and self._profiler is None:
+            import cProfile
+
+            self.profile_output = profile_output
+            profiler = cProfile.Profile()
+            profiler.enable()
+            self._profiler = profiler
+
+    def phase(self, name: str) -> ContextManager[None]:
+        """
+        Time a block of code. Phases can be nested, and if a phase runs
+        more than once (under the same parent) the times are added together
+        """
+        if not self.enabled:
+            return _NULL
+        return self._phase(name)
+
+    @contextmanager
+    def _phase(self, name: str) -> Iterator[None]:
+        parent = self._path
+        path = parent + (name,)
+        stats = self.phases.setdefault(path, [0.0, 0])
+        self._path = path
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._path = parent
+            stats[0] += time.perf_counter() - start
+            stats[1] += 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self) -> str:
+        lines = [f"ttally trace, total {time.perf_counter() - self.started:.4f}s"]
+        # print each phase under its parent, in the order they first ran
+        children: Dict[Tuple[str, ...], List[Tuple[str, ...]]] = {}
+        for path in self.phases:
+            children.setdefault(path[:-1], []).append(path)
+        width = max((len(p[-1]) + 2 * (len(p) - 1) for p in self.phases), default=0)
+
+        def _add(parent: Tuple[str, ...]) -> None:
+            for path in children.get(parent, []):
+                total, calls = self.phases[path]
+                label = f"{'  ' * (len(path) - 1)}{path[-1]}"
+                lines.append(
+                    f"  {label:<{width}}  {total:.4f}s  ({int(calls)} call{'' if calls == 1 else 's'})"
+                )
+                _add(path)
+
+        _add(())
+        if self.counters:
+            lines.append(
+                "  " + ", ".join(f"{k}={v}" for k, v in sorted(self.counters.items()))
+            )
+        return "\n".join(lines)
+
+    def report(self, file: Optional[TextIO] = None) -> None:
+        """
+        Print the summary (and save the profile, if enabled). Only happens once
+        """
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        out = file if file is not None else sys.stderr
+        if self._profiler is not None and self.profile_output is not None:
+            import cProfile
+
+            assert isinstance(self._profiler, cProfile.Profile)
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_output)
+            out.write(
+                f"Wrote profile to '{self.profile_output}', view with 'python3 -m pstats {self.profile_output}'\n"
+            )
+        out.write(self.summary() + "\n")
+        out.flush()
@@ -0,0 +1,167 @@
+"""
+Watch the data directory for changes, used by 'ttally update-cache --watch'
+
+On linux this uses inotify (through ctypes, so there are no extra dependencies),
+otherwise it falls back to polling the directory for changes
+"""
+
+import os
+import time
+import select
+import struct
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")
+
+
+class Watcher(ABC):
+    """
+    Returns the names of files in a directory which have changed
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    @abstractmethod
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        """
+        Block until some files have changed (or the timeout expires),
+        returning the names of the files which changed
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher(Watcher):
+    def __init__(self, directory: Path) -> None:
+        import ctypes
+        import ctypes.util
+
+        super().__init__(directory)
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd: int = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MODIFY | IN_CREATE | IN_DELETE | IN_MOVED_FROM
+        mask |= IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed: Set[str] = set()
+        at = 0
+        while at + _EVENT.size <= len(buf):
+            _, mask, _, length = _EVENT.unpack_from(buf, at)
+            at += _EVENT.size
+            name = buf[at : at + length].rstrip(b"\0")
+            at += length
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                raise RuntimeError(f"{self.directory} was removed")
+            if mask & IN_Q_OVERFLOW:
+                # some events were dropped, so everything might have changed
+                changed.update(os.listdir(self.directory))
+            elif name:
+                changed.add(os.fsdecode(name))
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+    def __init__(self, directory: Path, interval: float = 1.0) -> None:
+        super().__init__(directory)
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot: Dict[str, Tuple[int, int]] = {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file():
+                    st = entry.stat()
+                    snapshot[entry.name] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self._scan()
+            changed = {
+                name
+                for name in current.keys() | self.snapshot.keys()
+                if current.get(name) != self.snapshot.get(name)
+            }
+            self.snapshot = current
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            sleep_for = self.interval
+            if deadline is not None:
+                sleep_for = min(sleep_for, max(deadline - time.monotonic(), 0))
+            time.sleep(sleep_for)
+
+
+def make_watcher(directory: Path, *, poll_interval: float = 1.0) -> Watcher:
+    """
+    Use inotify if its available, else poll the directory
+    """
+    try:
+        return InotifyWatcher(directory)
+    except (OSError, AttributeError, TypeError):
+        return PollingWatcher(directory, interval=poll_interval)
+
+
+def watch_changes(
+    directory: Path, *, debounce: float = 0.5, poll_interval: float = 1.0
+) -> Iterator[Set[str]]:
+    """
+    Yields the names of the files which changed in a directory
+
+    Bursts of changes (e.g. syncthing syncing several files) are combined,
+    changes are only yielded once nothing has changed for 'debounce' seconds
+    """
+    watcher = make_watcher(directory, poll_interval=poll_interval)
+    try:
+        while True:
+            changed = watcher.wait()
+            while True:
+                more = watcher.wait(debounce)
+                if not more:
+                    break
+                changed |= more
+            # ignore hidden/temporary files (e.g. syncthing writes to
+            # .syncthing.*.tmp, and then renames it to the real name)
+            changed = {c for c in changed if not c.startswith(".")}
+            if changed:
+                yield changed
+    finally:
+        watcher.close()
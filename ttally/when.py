@@ -0,0 +1,343 @@
+"""
+Query items with python lambdas, used by 'ttally when' (and bin/ttally-when)
+
+Each query is a lambda filter, and the name of its argument is the model it
+runs against. All the queries for a model share one scan over its items,
+newest first. Queries which only need the most recent match (the action
+only uses 'recent(results)') stop as soon as they find one, and if every
+query for a model is like that, the rest of the items are never read
+"""
+
+import ast
+import json
+import time
+from datetime import datetime, timedelta
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Type,
+    Union,
+)
+
+import click
+
+from .schema import model_schema
+
+if TYPE_CHECKING:
+    from .core import Extension
+
+
+def when(item: NamedTuple) -> datetime:
+    dt_val = model_schema(type(item)).key(item)
+    assert isinstance(dt_val, datetime)
+    return dt_val.astimezone()
+
+
+def since(item: NamedTuple) -> timedelta:
+    return datetime.now().astimezone() - when(item)
+
+
+def recent(results: List[NamedTuple]) -> Optional[NamedTuple]:
+    if len(results) == 0:
+        return None
+    return max(results, key=when)
+
+
+MINUTE_IN_HOURS = 1 / 60
+
+
+def dt_humanize(dt: datetime) -> str:
+    import arrow
+
+    # if more than two days away, then just say in 'days'
+    # otherwise, say hours
+    hours_distance = abs((dt.timestamp() - time.time()) / 3600)
+    if hours_distance > 48:
+        return arrow.get(dt).humanize(granularity=["day"])
+    else:
+        if hours_distance < MINUTE_IN_HOURS:
+            return arrow.get(dt).humanize()
+        elif hours_distance < 2:
+            return arrow.get(dt).humanize(granularity=["minute"])
+        else:
+            return arrow.get(dt).humanize(granularity=["hour"])
+
+
+LineFormat = Literal["human", "json"]
+
+
+def format_dt(dt: datetime, date_fmt: str) -> str:
+    if date_fmt == "epoch":
+        return str(dt.timestamp())
+    elif date_fmt == "human":
+        return dt_humanize(dt)
+    elif date_fmt == "iso":
+        return dt.isoformat()
+    elif date_fmt == "date":
+        return dt.strftime("%Y-%m-%d")
+    try:
+        return dt.strftime(date_fmt)
+    except ValueError as e:
+        raise ValueError(
+            "Invalid date format, should be one of epoch, human, iso, date, or a valid strftime format"
+        ) from e
+
+
+def desc(
+    item: Optional[NamedTuple] = None,
+    *,
+    date_fmt: str = "human",
+    name: Optional[Union[str, Callable[[Optional[NamedTuple]], str]]] = None,
+    line_format: LineFormat = "human",
+    with_timedelta: Optional[timedelta] = None,
+) -> Optional[str]:
+    """
+    a helper that lets me print a description of an item in a more useful way
+
+    with_timedelta: if provided, will also include some fields that add the timedelta to the date.
+    name: if provided, will use string. A callable can also be passed, or an 'attribute string', like
+            'food.food' or 'food.when' to get the value of that attribute on the item
+
+    this lets me see the last time I did something, and when I should do it next
+    """
+    if line_format not in ("human", "json"):
+        raise ValueError(f"Unknown line format {line_format}, expected human or json")
+
+    use_name: str
+    if name is None and item is not None:
+        use_name = item.__class__.__name__.casefold()
+    elif callable(name):
+        use_name = name(item)
+    else:
+        use_name = name or "Untitled"
+
+    if item is None:
+        if line_format == "human":
+            return None
+        return json.dumps({"name": name, "when": None})
+
+    dt = when(item)
+    use_dt = format_dt(dt, date_fmt)
+    with_timedelta_dt: Optional[datetime] = None
+    td_str: Optional[str] = None
+    if with_timedelta:
+        with_timedelta_dt = dt + with_timedelta
+        td_str = format_dt(with_timedelta_dt, date_fmt)
+
+    if line_format == "human":
+        buf = f"{use_name}: {use_dt}"
+        if td_str:
+            buf += f" (next {td_str})"
+        return buf
+
+    d: Dict[str, Any] = {
+        "name": use_name,
+        "when": use_dt,
+        "epoch": int(dt.timestamp()),
+    }
+    if td_str and with_timedelta_dt:
+        d["next"] = td_str
+        d["next_epoch"] = int(with_timedelta_dt.timestamp())
+        d["expired"] = with_timedelta_dt < datetime.now().astimezone()
+    return json.dumps(d)
+
+
+def descs(items: List[Optional[NamedTuple]], **kwargs: Any) -> List[Optional[str]]:
+    return [desc(item, **kwargs) for item in items]
+
+
+def query_namespace() -> Dict[str, Any]:
+    """
+    The globals the queries (and any code passed with --eval) are evaluated with
+    """
+    return {
+        "json": json,
+        "time": time,
+        "datetime": datetime,
+        "timedelta": timedelta,
+        "when": when,
+        "since": since,
+        "recent": recent,
+        "desc": desc,
+        "descs": descs,
+        "dt_humanize": dt_humanize,
+        "format_dt": format_dt,
+    }
+
+
+QueryFunc = Callable[[NamedTuple], bool]
+
+
+def _infer_model(
+    query: QueryFunc, models: Dict[str, Type[NamedTuple]]
+) -> Type[NamedTuple]:
+    import inspect
+
+    # the name of the argument is the model
+    params = list(inspect.signature(query).parameters)
+    if len(params) != 1:
+        raise ValueError(
+            f"Query must take exactly one argument, the name of the model, known={list(models)}"
+        )
+    if params[0] not in models:
+        raise ValueError(f"Unknown model type, known={list(models)}, got={params[0]}")
+    return models[params[0]]
+
+
+def _only_most_recent(action_str: str) -> bool:
+    """
+    If 'results' is only ever used as recent(results), only the newest match is needed
+    """
+    try:
+        tree = ast.parse(action_str.strip(), mode="eval")
+    except SyntaxError:
+        return False
+    uses = 0
+    recent_calls = 0
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == "results":
+            uses += 1
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id == "recent"
+            and len(node.args) == 1
+            and not node.keywords
+            and isinstance(node.args[0], ast.Name)
+            and node.args[0].id == "results"
+        ):
+            recent_calls += 1
+    return uses > 0 and uses == recent_calls
+
+
+class Query(NamedTuple):
+    filter: QueryFunc
+    raw_str: str
+    model_type: Type[NamedTuple]
+    action: Optional[Callable[[Any], None]]
+    action_on_results: bool = False
+    # if the action only needs the newest matching item
+    most_recent: bool = False
+
+    @classmethod
+    def from_str(
+        cls,
+        s: str,
+        *,
+        models: Dict[str, Type[NamedTuple]],
+        namespace: Dict[str, Any],
+    ) -> "Query":
+        """
+        Parse a query, like 'lambda food: ...', optionally with '>> action'
+        to run for each item, or '>>> action' to run on the list of 'results'
+        """
+        if ">>>" in s:
+            query_str, _, action_str = s.partition(">>>")
+        elif ">>" in s:
+            query_str, _, action_str = s.partition(">>")
+        else:
+            query_str, action_str = s, ""
+
+        query = eval(query_str, namespace)
+        if not callable(query):
+            raise ValueError(f"Query must be callable, got {query}")
+        model = _infer_model(query, models)
+
+        if ">>>" in s:
+            return cls(
+                filter=query,
+                raw_str=s,
+                model_type=model,
+                action=eval(f"lambda results: {action_str}", namespace),
+                action_on_results=True,
+                most_recent=namespace.get("recent") is recent
+                and _only_most_recent(action_str),
+            )
+        elif ">>" in s:
+            return cls(
+                filter=query,
+                raw_str=s,
+                model_type=model,
+                action=eval(f"lambda {model.__name__.casefold()}: {action_str}", namespace),
+            )
+        else:
+            return cls(filter=query, raw_str=s, model_type=model, action=None)
+
+    def run_action(self, item: Union[List[NamedTuple], NamedTuple]) -> None:
+        if self.action is None:
+            return
+        try:
+            self.action(item)
+        except NameError as ne:
+            if ne.name == "results":
+                if ">>>" not in self.raw_str:
+                    click.echo(
+                        f"Error: For '{self.raw_str}', to use the 'results' variable, you must have >>> instead of >> in your query",
+                        err=True,
+                    )
+                    exit(1)
+            elif ne.name == self.model_type.__name__.casefold():
+                if ">>>" in self.raw_str:
+                    click.echo(
+                        f"Error: For '{self.raw_str}', when using >>>, you must use the variable 'results' to refer to the list of results, Use >> to access each item individually",
+                        err=True,
+                    )
+                    exit(1)
+            raise ne
+
+    def output(self, matches: List[NamedTuple]) -> None:
+        """
+        Run the action on the matching items (oldest first), or print them
+        """
+        if self.action is None:
+            for item in matches:
+                print(item)
+        elif self.action_on_results:
+            self.run_action(matches)
+        else:
+            for item in matches:
+                self.run_action(item)
+
+
+def run_queries(ext: "Extension", queries: Sequence[Query]) -> None:
+    """
+    Scan the items for each model once, matching every query for that model,
+    then run the actions for each query in the order they were given
+    """
+    by_model: Dict[Type[NamedTuple], List[int]] = {}
+    for i, q in enumerate(queries):
+        by_model.setdefault(q.model_type, []).append(i)
+
+    matches: List[List[NamedTuple]] = [[] for _ in queries]
+    for nt, indexes in by_model.items():
+        every = [(queries[i].filter, matches[i]) for i in indexes if not queries[i].most_recent]
+        newest = [(queries[i].filter, matches[i]) for i in indexes if queries[i].most_recent]
+        scanned = 0
+        with ext.trace("when_scan"):
+            for item in ext.iter_newest(nt):
+                scanned += 1
+                for func, found in every:
+                    if func(item):
+                        found.append(item)
+                matched = False
+                for func, found in newest:
+                    if func(item):
+                        found.append(item)
+                        matched = True
+                if matched:
+                    # these are done, they only need the newest match
+                    newest = [(func, found) for func, found in newest if not found]
+                    if not newest and not every:
+                        break
+        ext.tracer.count("when_items_scanned", scanned)
+
+    for q, found in zip(queries, matches):
+        found.reverse()
+        q.output(found)